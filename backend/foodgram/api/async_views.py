@@ -0,0 +1,138 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+
+POOLED_ROUTES = (
+    'recipes-list',
+    'recipes-detail',
+    'recipes-download-shopping-cart',
+    'recipes-timeline',
+    'ingredients-list',
+    'tags-list',
+    'tags-detail',
+)
+
+
+@functools.lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.ASYNC_DB_WORKERS,
+        thread_name_prefix='api-db'
+    )
+
+
+def run_view(view, request, *args, **kwargs):
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def pooled_view(view):
+    """Асинхронная обёртка синхронного view для ASGI.
+
+    Запросы к БД выполняются в пуле из ASYNC_DB_WORKERS потоков, поэтому
+    медленный запрос занимает поток пула, а не весь воркер.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            get_executor(),
+            functools.partial(run_view, view, request, *args, **kwargs)
+        )
+    return wrapper
+
+
+def pool_routes(urlpatterns):
+    for pattern in urlpatterns:
+        if getattr(pattern, 'name', None) in POOLED_ROUTES:
+            pattern.callback = pooled_view(pattern.callback)
+    return urlpatterns
+
+
+class StreamWorkers:
+    """Потоки для отдачи потоковых ответов, не больше ASYNC_STREAM_WORKERS.
+
+    Курсор и соединение с БД привязаны к потоку, поэтому ответ от первой
+    части до close() читается в одном потоке; свободного потока ждут.
+    """
+
+    def __init__(self):
+        self._free = None
+
+    async def acquire(self):
+        if self._free is None:
+            self._free = asyncio.Queue()
+            for _ in range(settings.ASYNC_STREAM_WORKERS):
+                self._free.put_nowait(ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix='api-stream'
+                ))
+        return await self._free.get()
+
+    def release(self, worker):
+        self._free.put_nowait(worker)
+
+
+stream_workers = StreamWorkers()
+
+
+class PooledASGIHandler(ASGIHandler):
+    """ASGI-обработчик, отдающий потоковые ответы по частям из потока.
+
+    Django 3.2 перебирает streaming_content прямо в event loop, а выгрузка
+    списка покупок читает строки из БД по мере отдачи. Части ответа
+    строятся в одном из потоков stream_workers, соединение с БД
+    закрывается в нём же.
+    """
+
+    async def send_response(self, response, send):
+        if response.streaming:
+            await self.send_streaming(response, send)
+        else:
+            await super().send_response(response, send)
+
+    async def send_streaming(self, response, send):
+        headers = [
+            (
+                header.encode('ascii') if isinstance(header, str) else header,
+                value.encode('latin1') if isinstance(value, str) else value
+            )
+            for header, value in response.items()
+        ]
+        headers.extend(
+            (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+            for cookie in response.cookies.values()
+        )
+        loop = asyncio.get_running_loop()
+        worker = await stream_workers.acquire()
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': response.status_code,
+                'headers': headers,
+            })
+            parts = iter(response)
+            part = await loop.run_in_executor(worker, next, parts, None)
+            while part is not None:
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+                part = await loop.run_in_executor(worker, next, parts, None)
+            await send({'type': 'http.response.body'})
+        finally:
+            try:
+                await loop.run_in_executor(worker, response.close)
+            finally:
+                stream_workers.release(worker)
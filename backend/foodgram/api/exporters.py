@@ -0,0 +1,68 @@
+import csv
+import hashlib
+import json
+
+from django.utils.http import quote_etag
+from recipes.models import ShoppingListItem
+from rest_framework.negotiation import DefaultContentNegotiation
+
+CHUNK_SIZE = 500
+
+
+class ExportContentNegotiation(DefaultContentNegotiation):
+    """Параметр format выбирает формат файла, а не рендерер ответа."""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class Echo:
+    """Псевдо-файл, возвращающий записанную строку для csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_list_rows(user):
+    return ShoppingListItem.objects.filter(user=user).values_list(
+        'ingredients__name', 'ingredients__measurement_unit', 'amount'
+    ).order_by('ingredients__name').iterator(chunk_size=CHUNK_SIZE)
+
+
+def shopping_list_etag(user, export_format):
+    """ETag по тем же строкам, что попадут в файл, включая названия."""
+    digest = hashlib.md5(export_format.encode())
+    for name, measurement_unit, amount in shopping_list_rows(user):
+        digest.update(f'{name}\0{measurement_unit}\0{amount};'.encode())
+    return quote_etag(digest.hexdigest())
+
+
+def export_txt(rows):
+    for name, measurement_unit, amount in rows:
+        yield f'{name.capitalize()} ({measurement_unit}) - {amount} \n'
+
+
+def export_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Единицы измерения', 'Количество'))
+    for name, measurement_unit, amount in rows:
+        yield writer.writerow((name.capitalize(), measurement_unit, amount))
+
+
+def export_json(rows):
+    separator = '['
+    for name, measurement_unit, amount in rows:
+        yield separator + json.dumps({
+            'name': name.capitalize(),
+            'measurement_unit': measurement_unit,
+            'amount': amount,
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+EXPORTERS = {
+    'txt': (export_txt, 'text/plain; charset=utf-8'),
+    'csv': (export_csv, 'text/csv; charset=utf-8'),
+    'json': (export_json, 'application/json; charset=utf-8'),
+}
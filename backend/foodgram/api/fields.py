@@ -0,0 +1,53 @@
+import base64
+import binascii
+import re
+import uuid
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+DECODE_CHUNK_SIZE = 64 * 1024
+SPOOL_SIZE = 1024 * 1024
+
+
+class RecipeImageField(Base64ImageField):
+    """Base64-картинка, декодируемая по частям с проверкой размеров."""
+
+    def to_internal_value(self, base64_data):
+        if base64_data in self.EMPTY_VALUES:
+            return None
+        if not isinstance(base64_data, str):
+            return super().to_internal_value(base64_data)
+        payload = base64_data.rpartition(';base64,')[2]
+        if re.search(r'\s', payload):
+            payload = ''.join(payload.split())
+        if len(payload) * 3 // 4 > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise ValidationError('Картинка слишком большая.')
+        buffer = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        try:
+            for start in range(0, len(payload), DECODE_CHUNK_SIZE):
+                buffer.write(base64.b64decode(
+                    payload[start:start + DECODE_CHUNK_SIZE], validate=True
+                ))
+            buffer.seek(0)
+            image = Image.open(buffer)
+            width, height = image.size
+            image_format = (image.format or '').lower()
+            image.verify()
+        except (binascii.Error, ValueError, OSError,
+                Image.DecompressionBombError):
+            buffer.close()
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        extension = 'jpg' if image_format == 'jpeg' else image_format
+        if extension not in self.ALLOWED_TYPES:
+            buffer.close()
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            buffer.close()
+            raise ValidationError('Слишком большое разрешение картинки.')
+        buffer.seek(0)
+        return File(buffer, name=f'{uuid.uuid4()}.{extension}')
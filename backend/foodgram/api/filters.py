@@ -1,22 +1,25 @@
 import django_filters
+from django.db.models import Exists, F, OuterRef, Q
 from django_filters.rest_framework import FilterSet, filters
-from recipes.models import Recipe
-from rest_framework.filters import SearchFilter
+from recipes.cache import tag_cache
+from recipes.ingredient_index import ingredient_index
+from recipes.models import TAGS_MASK_SIZE, Recipe, tags_mask
+from recipes.relations import favorite_ids, shopping_cart_ids
+from rest_framework.filters import BaseFilterBackend
 
-CHOICES = (
-    ('breakfast', 'breakfast'),
-    ('lunch', 'lunch'),
-    ('dinner', 'dinner')
-)
+IN_FILTER_LIMIT = 500
+
+
+def tag_choices():
+    return [(tag.slug, tag.name) for tag in tag_cache.all()]
 
 
 class RecipeFilter(FilterSet):
     """Фильтрация рецептов."""
 
     tags = django_filters.MultipleChoiceFilter(
-        field_name='tags__slug',
-        choices=CHOICES,
-        lookup_expr='icontains'
+        choices=tag_choices,
+        method='get_tags'
     )
     is_favorited = filters.BooleanFilter(
         method='get_is_favorited'
@@ -24,27 +27,49 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
-    author = filters.CharFilter(
-        field_name='author__id',
-        lookup_expr='icontains'
-    )
+    author = filters.NumberFilter(field_name='author')
 
     class Meta:
         model = Recipe
         fields = ['tags', 'author']
 
+    def get_tags(self, queryset, name, value):
+        tag_ids = [tag.pk for tag in tag_cache.all() if tag.slug in value]
+        condition = Q(tag_match__gt=0)
+        unmasked = [pk for pk in tag_ids if pk > TAGS_MASK_SIZE]
+        if unmasked:
+            condition |= Q(Exists(Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'), tag__in=unmasked
+            )))
+        return queryset.alias(
+            tag_match=F('tags_mask').bitand(tags_mask(tag_ids))
+        ).filter(condition)
+
+    def filter_user_recipes(self, queryset, relation, value):
+        user = self.request.user
+        if not value or user.is_anonymous:
+            return queryset
+        recipe_ids = relation.get(user.pk)
+        if len(recipe_ids) > IN_FILTER_LIMIT:
+            return queryset.filter(pk__in=relation.model.objects.filter(
+                user=user
+            ).values('recipes'))
+        return queryset.filter(pk__in=list(recipe_ids))
+
     def get_is_favorited(self, queryset, name, value):
-        if value and not self.request.user.is_anonymous:
-            return queryset.filter(favorite__user=self.request.user)
-        return queryset
+        return self.filter_user_recipes(queryset, favorite_ids, value)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        if value and not self.request.user.is_anonymous:
-            return queryset.filter(shop__user=self.request.user)
-        return queryset
+        return self.filter_user_recipes(queryset, shopping_cart_ids, value)
 
 
-class CustomSearchFilter(SearchFilter):
-    """Поиск игредиентов."""
+class IngredientSearchFilter(BaseFilterBackend):
+    """Поиск игредиентов по индексу: сначала совпадения по началу."""
 
     search_param = 'name'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if view.action != 'list' or not query.strip():
+            return queryset
+        return ingredient_index.search(query)
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from urllib.error import URLError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = (
+    '/api/recipes/',
+    '/api/recipes/?tags=breakfast',
+    '/api/ingredients/?name=мо',
+    '/api/tags/',
+)
+
+
+def process_rss(pid):
+    """Суммарная резидентная память процесса и его потомков, КиБ."""
+    total = 0
+    pending = [str(pid)]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    pending.extend(f.read().split())
+        except OSError:
+            continue
+    return total
+
+
+class Command(BaseCommand):
+    """Нагрузочный замер запущенного сервера."""
+
+    help = (
+        'Отправляет запросы к запущенному серверу из нескольких потоков и '
+        'печатает пропускную способность и задержки. Для сравнения WSGI и '
+        'ASGI запустите оба варианта с одинаковым числом воркеров и '
+        'передайте --pid мастер-процесса, чтобы сравнить и память.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--path', action='append', dest='paths')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--duration', type=float, default=10.0)
+        parser.add_argument('--token')
+        parser.add_argument('--pid', type=int)
+
+    def worker(self, urls, headers, deadline, results, errors):
+        position = 0
+        while time.monotonic() < deadline:
+            url = urls[position % len(urls)]
+            position += 1
+            started = time.perf_counter()
+            try:
+                with urlopen(Request(url, headers=headers), timeout=30) as r:
+                    r.read()
+            except (URLError, OSError):
+                errors.append(url)
+                continue
+            results.append((time.perf_counter() - started) * 1000)
+
+    def handle(self, *args, **options):
+        urls = [
+            options['url'].rstrip('/') + quote(path, safe='/?=&')
+            for path in options['paths'] or DEFAULT_PATHS
+        ]
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        results, errors = [], []
+        deadline = time.monotonic() + options['duration']
+        threads = [
+            threading.Thread(
+                target=self.worker,
+                args=(urls, headers, deadline, results, errors)
+            )
+            for _ in range(options['concurrency'])
+        ]
+        rss = []
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            if options['pid']:
+                rss.append(process_rss(options['pid']))
+            time.sleep(0.5)
+        if not results:
+            raise CommandError(f'Нет успешных ответов, ошибок: {len(errors)}')
+        results.sort()
+        self.stdout.write(
+            f'Запросов: {len(results)}, ошибок: {len(errors)}, '
+            f'{len(results) / options["duration"]:.1f} запросов/с'
+        )
+        self.stdout.write(
+            f'Задержка: медиана {results[len(results) // 2]:.1f} мс, '
+            f'p95 {results[int(len(results) * 0.95)]:.1f} мс, '
+            f'макс. {results[-1]:.1f} мс'
+        )
+        if rss:
+            self.stdout.write(
+                f'Память сервера: макс. {max(rss) / 1024:.1f} МиБ'
+            )
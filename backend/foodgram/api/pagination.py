@@ -1,4 +1,38 @@
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def approximate_count(queryset):
+    """Оценка числа строк по плану запроса (точный подсчёт вне PostgreSQL)."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class ApproximateCountPaginator(Paginator):
+    """Пагинатор для админки, не выполняющий COUNT(*) по всей таблице."""
+
+    @cached_property
+    def count(self):
+        return approximate_count(self.object_list)
 
 
 class RecipeResultSetPagination(pagination.PageNumberPagination):
@@ -6,3 +40,101 @@ class RecipeResultSetPagination(pagination.PageNumberPagination):
 
     page_query_param = 'page'
     page_size_query_param = 'limit'
+
+
+class ApproximateCountCursorPagination(pagination.CursorPagination):
+    """Курсорный пагинатор с необязательной приблизительной оценкой count."""
+
+    page_size_query_param = 'limit'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.queryset = queryset
+        self.request = request
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.request.query_params.get(self.count_query_param) == 'approx':
+            response.data['count'] = approximate_count(self.queryset)
+        return response
+
+
+class RecipeCursorPagination(ApproximateCountCursorPagination):
+    """Курсорный пагинатор для бесконечной ленты рецептов."""
+
+    ordering = ('-pub_date', '-id')
+
+
+class UserCursorPagination(ApproximateCountCursorPagination):
+    """Курсорный пагинатор для списка пользователей."""
+
+    ordering = ('id',)
+
+
+class TimelinePagination(pagination.BasePagination):
+    """Курсорный пагинатор ленты подписок по (pub_date, id) без COUNT(*)."""
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return page_size if page_size > 0 else api_settings.PAGE_SIZE
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            pub_date, recipe_id = urlsafe_b64decode(
+                encoded.encode('ascii')
+            ).decode('ascii').split(',')
+            return datetime.fromisoformat(pub_date), int(recipe_id)
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        recipe_id, pub_date = position
+        cursor = urlsafe_b64encode(
+            f'{pub_date.isoformat()},{recipe_id}'.encode('ascii')
+        ).decode('ascii')
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, cursor
+        )
+
+    def paginate_rows(self, fetch, request):
+        """Строки (id, pub_date) страницы; fetch(before, limit) читает их."""
+        self.request = request
+        limit = self.get_page_size(request)
+        rows = fetch(self.decode_cursor(request), limit + 1)
+        self.next_position = rows[limit - 1] if len(rows) > limit else None
+        return rows[:limit]
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+
+class CursorPaginationMixin:
+    """Переключает вьюсет на курсорную пагинацию по параметру запроса."""
+
+    cursor_pagination_class = None
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if self.cursor_pagination_class is not None and (
+                params.get('pagination') == 'cursor' or 'cursor' in params
+            ):
+                self._paginator = self.cursor_pagination_class()
+        return super().paginator
@@ -1,10 +1,16 @@
 from django.contrib.auth import get_user_model
-from drf_extra_fields.fields import Base64ImageField
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from recipes.cache import tag_cache
+from recipes.images import schedule_variants, variant_urls
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingListItem, Tag)
+from recipes.relations import favorite_ids, shopping_cart_ids
 from rest_framework import serializers
 from users.serializers import CustomUserSerializer
 
+from .fields import RecipeImageField
+
 User = get_user_model()
 
 
@@ -50,7 +56,7 @@ class IngredientSerializer(serializers.ModelSerializer):
 class RecipeIngredientSerializer(serializers.ModelSerializer):
     """Сериализатор для записи количества ингридиента."""
 
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all(),)
+    id = serializers.IntegerField()
 
     class Meta:
         fields = ('id', 'amount')
@@ -69,11 +75,15 @@ class RecipeMiniSerializer(serializers.ModelSerializer):
     """Сериализатор для краткой информации о рецепте."""
 
     image = serializers.ImageField(use_url=True)
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
         model = Recipe
 
+    def get_image_variants(self, obj):
+        return variant_urls(obj, self.context.get('request'))
+
 
 class RecipeReadSerializer(serializers.ModelSerializer):
     """Сериализатор для полного просмотра рецептов."""
@@ -84,15 +94,19 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     is_in_shopping_cart = serializers.SerializerMethodField()
     ingredients = serializers.SerializerMethodField()
     image = serializers.ImageField(use_url=True)
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time')
+                  'is_in_shopping_cart', 'name', 'image', 'image_variants',
+                  'text', 'cooking_time')
         model = Recipe
 
+    def get_image_variants(self, obj):
+        return variant_urls(obj, self.context.get('request'))
+
     def get_ingredients(self, obj):
-        ingredients = RecipeIngredient.objects.filter(recipes=obj)
+        ingredients = obj.recipeingredient_set.all()
         serializer = IngredientSerializer(ingredients, many=True)
         return serializer.data
 
@@ -100,15 +114,13 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
-        user = request.user
-        return Favorite.objects.filter(recipes=obj, user=user).exists()
+        return obj.pk in favorite_ids.get(request.user.pk)
 
     def get_is_in_shopping_cart(self, obj):
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
-        user = request.user
-        return ShoppingCart.objects.filter(recipes=obj, user=user).exists()
+        return obj.pk in shopping_cart_ids.get(request.user.pk)
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
@@ -116,10 +128,8 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
 
     author = CustomUserSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True)
-    image = Base64ImageField(use_url=False)
+    tags = serializers.ListField(child=serializers.IntegerField())
+    image = RecipeImageField(use_url=False)
 
     class Meta:
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
@@ -127,6 +137,30 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                   'cooking_time')
         model = Recipe
 
+    def validate_ingredients(self, value):
+        ids = [ingredient['id'] for ingredient in value]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError(
+                'Ингредиенты не должны повторяться.'
+            )
+        found = Ingredient.objects.in_bulk(ids)
+        missing = [pk for pk in ids if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {missing}.'
+            )
+        for ingredient in value:
+            ingredient['id'] = found[ingredient['id']]
+        return value
+
+    def validate_tags(self, value):
+        tags = {tag.pk: tag for tag in tag_cache.all()}
+        missing = [pk for pk in value if pk not in tags]
+        if missing:
+            raise serializers.ValidationError(f'Теги не найдены: {missing}.')
+        return [tags[pk] for pk in dict.fromkeys(value)]
+
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
@@ -140,76 +174,96 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             for ingredient in ingredients
         ]
         RecipeIngredient.objects.bulk_create(objs=recipeingredient_new)
+        if recipes.image:
+            schedule_variants(recipes)
         return recipes
 
-    def update(self, instance, validated_data):
-        RecipeIngredient.objects.filter(recipes=instance).delete()
-        instance.tags.set(validated_data.get('tags'))
-        instance.image = validated_data.get('image', instance.image)
-        instance.name = validated_data.get('name')
-        instance.text = validated_data.get('text')
-        instance.cooking_time = validated_data.get('cooking_time')
-        instance.save()
-        ingredients = validated_data.get('ingredients')
-        recipeingredient_new = [RecipeIngredient(
-            recipes=instance,
-            ingredients=ingredient['id'],
-            amount=ingredient['amount'])
+    def update_tags(self, instance, tags):
+        current = set(instance.tags.values_list('id', flat=True))
+        new = {tag.pk for tag in tags}
+        if current - new:
+            instance.tags.remove(*(current - new))
+        if new - current:
+            instance.tags.add(*(new - current))
+
+    def update_ingredients(self, instance, ingredients):
+        """Применяет к составу рецепта только изменившиеся строки."""
+        existing = {
+            row.ingredients_id: row
+            for row in RecipeIngredient.objects.filter(recipes=instance)
+        }
+        new_amounts = {
+            ingredient['id'].id: ingredient['amount']
             for ingredient in ingredients
+        }
+        old_amounts = {
+            ingredient_id: row.amount
+            for ingredient_id, row in existing.items()
+        }
+        if new_amounts == old_amounts:
+            return False
+        removed = [
+            row.pk for ingredient_id, row in existing.items()
+            if ingredient_id not in new_amounts
         ]
-        RecipeIngredient.objects.bulk_create(objs=recipeingredient_new)
+        if removed:
+            RecipeIngredient.objects.filter(pk__in=removed).delete()
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            row = existing.get(ingredient_id)
+            if row is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipes=instance, ingredients_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in existing
+        ])
+        ShoppingListItem.objects.update_recipe(
+            instance.id, old_amounts, new_amounts
+        )
+        return True
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        image = validated_data.pop('image', None)
+        update_fields = [
+            field for field, value in validated_data.items()
+            if getattr(instance, field) != value
+        ]
+        for field in update_fields:
+            setattr(instance, field, validated_data[field])
+        if image:
+            instance.image = image
+            instance.image_variants = {}
+            update_fields += ['image', 'image_variants']
+        if tags is not None:
+            self.update_tags(instance, tags)
+        if ingredients is not None and self.update_ingredients(
+            instance, ingredients
+        ):
+            update_fields.append('updated_at')
+        if update_fields:
+            instance.save(update_fields={*update_fields, 'updated_at'})
+        if image:
+            schedule_variants(instance)
         return instance
 
     def to_representation(self, instance):
-        serializer = RecipeReadSerializer(instance)
-        return serializer.data
-
-
-class ShopSerializer(serializers.ModelSerializer):
-    """Сериализатор для добавления в список покупок."""
-
-    recipes = serializers.PrimaryKeyRelatedField(
-        queryset=Recipe.objects.all(), required=False)
-    user = serializers.PrimaryKeyRelatedField(
-        queryset=User.objects.all(),
-        required=False
-    )
-
-    def validate(self, data):
-        user = data.get('user')
-        recipes = data.get('recipes')
-        if ShoppingCart.objects.filter(user=user, recipes=recipes).exists():
-            raise serializers.ValidationError('Вы уже добавили в корзину.')
-        return data
-
-    class Meta:
-        fields = ('recipes', 'user')
-        model = ShoppingCart
-
-    def to_representation(self, instance):
-        serializer = RecipeMiniSerializer(instance.recipes)
-        return serializer.data
-
-
-class FavoriteSerializer(serializers.ModelSerializer):
-    """Сериализатор для получения информации об избранных."""
-
-    recipes = serializers.PrimaryKeyRelatedField(
-        queryset=Recipe.objects.all(), required=False)
-    user = serializers.PrimaryKeyRelatedField(
-        queryset=User.objects.all(), required=False)
-
-    def validate(self, data):
-        user = data.get('user')
-        recipes = data.get('recipes')
-        if Favorite.objects.filter(user=user, recipes=recipes).exists():
-            raise serializers.ValidationError("Вы уже добавили в избранное.")
-        return data
-
-    class Meta:
-        model = Favorite
-        fields = ('recipes', 'user')
-
-    def to_representation(self, instance):
-        serializer = RecipeMiniSerializer(instance.recipes)
+        prefetch_related_objects(
+            [instance],
+            'tags',
+            Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredients'
+                )
+            )
+        )
+        serializer = RecipeReadSerializer(instance, context=self.context)
         return serializer.data
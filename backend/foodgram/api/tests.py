@@ -0,0 +1,564 @@
+from io import StringIO
+from threading import Barrier, Thread
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import (TestCase, TransactionTestCase, override_settings,
+                         skipUnlessDBFeature)
+from django.test.utils import CaptureQueriesContext
+from recipes.models import (Favorite, Follow, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag, TimelineEntry)
+from rest_framework.test import APIClient
+
+User = get_user_model()
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+class QueryCountMixin:
+    """Подсчёт запросов к БД на один холодный запрос к API."""
+
+    def count_queries(self, url, user=None):
+        cache.clear()
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(context.captured_queries)
+
+    def assert_constant(self, url, user=None):
+        self.assertEqual(
+            self.count_queries(f'{url}limit=2', user),
+            self.count_queries(f'{url}limit=10', user)
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeListQueryCountTest(QueryCountMixin, TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                username=f'user{index}',
+                email=f'user{index}@example.com',
+                password='password'
+            )
+            for index in range(3)
+        ]
+        tags = [
+            Tag.objects.create(name=name, color=color, slug=name)
+            for name, color in (('breakfast', '#E26C2D'), ('lunch', '#49B64E'))
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {index}', measurement_unit='г'
+            )
+            for index in range(6)
+        ]
+        for index in range(12):
+            recipe = Recipe.objects.create(
+                author=cls.users[index % 3],
+                name=f'рецепт {index}',
+                image='images/recipe.png',
+                text='текст',
+                cooking_time=10
+            )
+            recipe.tags.set(tags[:index % 2 + 1])
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(recipes=recipe, ingredients=ingredient,
+                                 amount=index + 1)
+                for ingredient in ingredients[index % 3:index % 3 + 3]
+            ])
+            if index % 2:
+                Favorite.objects.create(user=cls.users[0], recipes=recipe)
+            if index % 3:
+                ShoppingCart.objects.create(user=cls.users[0], recipes=recipe)
+
+    def test_anonymous_list(self):
+        self.assert_constant('/api/recipes/?')
+
+    def test_authenticated_list(self):
+        self.assert_constant('/api/recipes/?', self.users[0])
+
+    def test_filtered_list(self):
+        self.assert_constant(
+            '/api/recipes/?tags=breakfast&is_favorited=1&', self.users[0]
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class UserQueryCountTest(QueryCountMixin, TestCase):
+    """is_subscribed не добавляет запросов на каждого пользователя."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                username=f'author{index}',
+                email=f'author{index}@example.com',
+                password='password'
+            )
+            for index in range(12)
+        ]
+        cls.viewer = cls.users[0]
+        for author in cls.users[1::2]:
+            Follow.objects.create(user=cls.viewer, following=author)
+        for author in cls.users:
+            Recipe.objects.create(
+                author=author, name=f'рецепт {author.username}',
+                image='images/recipe.png', text='текст', cooking_time=10
+            )
+
+    def test_anonymous_user_list(self):
+        self.assert_constant('/api/users/?')
+
+    def test_authenticated_user_list(self):
+        self.assert_constant('/api/users/?', self.viewer)
+
+    def test_me(self):
+        queries = self.count_queries('/api/users/me/', self.viewer)
+        for author in self.users[2::2]:
+            Follow.objects.create(user=self.viewer, following=author)
+        self.assertEqual(
+            self.count_queries('/api/users/me/', self.viewer), queries
+        )
+
+    def test_recipe_list_authors(self):
+        self.assert_constant('/api/recipes/?', self.viewer)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SubscriptionsTest(QueryCountMixin, TestCase):
+    """Подписки отдают последние recipes_limit рецептов каждого автора."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            password='password'
+        )
+        cls.latest = {}
+        for index in range(5):
+            author = User.objects.create_user(
+                username=f'cook{index}', email=f'cook{index}@example.com',
+                password='password'
+            )
+            Follow.objects.create(user=cls.viewer, following=author)
+            recipes = [
+                Recipe.objects.create(
+                    author=author, name=f'рецепт {index}-{number}',
+                    image='images/recipe.png', text='текст', cooking_time=10
+                )
+                for number in range(4)
+            ]
+            cls.latest[author.pk] = [recipe.pk for recipe in recipes[:1:-1]]
+
+    def test_recipes_limit(self):
+        client = APIClient()
+        client.force_authenticate(self.viewer)
+        response = client.get(
+            '/api/users/subscriptions/?limit=10&recipes_limit=2'
+        )
+        self.assertEqual(
+            {
+                author['id']: [recipe['id'] for recipe in author['recipes']]
+                for author in response.json()['results']
+            },
+            self.latest
+        )
+
+    def test_query_count(self):
+        self.assert_constant(
+            '/api/users/subscriptions/?recipes_limit=2&', self.viewer
+        )
+
+
+@override_settings(CACHES=TEST_CACHES, TIMELINE_FANOUT_LIMIT=1)
+class TimelineTest(TestCase):
+    """Лента сливает разложенные и читаемые при запросе рецепты."""
+
+    def setUp(self):
+        cache.clear()
+        self.viewer, self.fan, self.author, self.celebrity, self.stranger = [
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com',
+                password='password'
+            )
+            for name in ('viewer', 'fan', 'author', 'celebrity', 'stranger')
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(user=self.viewer, following=self.author)
+            Follow.objects.create(user=self.viewer, following=self.celebrity)
+            Follow.objects.create(user=self.fan, following=self.celebrity)
+        self.recipes = []
+        for index in range(7):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.recipes.append(Recipe.objects.create(
+                    author=(self.author, self.celebrity)[index % 2],
+                    name=f'рецепт {index}', image='images/recipe.png',
+                    text='текст', cooking_time=10
+                ))
+        Recipe.objects.create(
+            author=self.stranger, name='чужой рецепт',
+            image='images/recipe.png', text='текст', cooking_time=10
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def read_timeline(self, url='/api/recipes/timeline/?limit=3'):
+        ids = []
+        while url is not None:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            for query in context.captured_queries:
+                self.assertNotIn('COUNT(', query['sql'])
+            ids.extend(recipe['id'] for recipe in response.json()['results'])
+            url = response.json()['next']
+        return ids
+
+    def test_pages_merge_by_pub_date(self):
+        self.assertFalse(TimelineEntry.objects.filter(
+            recipe__author=self.celebrity
+        ).exists())
+        self.assertEqual(
+            self.read_timeline(),
+            [recipe.pk for recipe in reversed(self.recipes)]
+        )
+
+    def test_author_dropping_under_limit_is_filled(self):
+        with self.captureOnCommitCallbacks():
+            Follow.objects.unfollow(self.fan.pk, self.celebrity.pk)
+        self.celebrity.refresh_from_db()
+        self.assertTrue(self.celebrity.timeline_pulled)
+        self.assertEqual(
+            self.read_timeline(),
+            [recipe.pk for recipe in reversed(self.recipes)]
+        )
+        call_command('fill_timelines', stdout=StringIO())
+        self.celebrity.refresh_from_db()
+        self.assertFalse(self.celebrity.timeline_pulled)
+        self.assertEqual(
+            TimelineEntry.objects.filter(
+                user=self.viewer, recipe__author=self.celebrity
+            ).count(),
+            3
+        )
+        self.assertEqual(
+            self.read_timeline(),
+            [recipe.pk for recipe in reversed(self.recipes)]
+        )
+
+    def test_filtered(self):
+        favorites = [self.recipes[1].pk, self.recipes[4].pk]
+        Favorite.objects.add_recipes(self.viewer.pk, favorites)
+        self.assertEqual(
+            self.read_timeline('/api/recipes/timeline/?is_favorited=1'),
+            favorites[::-1]
+        )
+
+    def test_invalid_cursor(self):
+        self.assertEqual(
+            self.client.get('/api/recipes/timeline/?cursor=xyz').status_code,
+            404
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeSearchTest(TestCase):
+    """Результаты поиска идут по релевантности в любом режиме пагинации."""
+
+    def setUp(self):
+        author = User.objects.create_user(
+            username='searcher', email='searcher@example.com',
+            password='password'
+        )
+        self.recipes = []
+        for name, text in (('борщ', 'суп'), ('суп', 'борщ не варить')):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.recipes.append(Recipe.objects.create(
+                    author=author, name=name, image='images/recipe.png',
+                    text=text, cooking_time=10
+                ))
+        self.client = APIClient()
+
+    def test_cursor_mode_keeps_rank(self):
+        for params in ('', '&pagination=cursor', '&cursor=abc'):
+            response = self.client.get(f'/api/recipes/search/?q=борщ{params}')
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(
+                [recipe['id'] for recipe in response.json()['results']],
+                [recipe.pk for recipe in self.recipes]
+            )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ShoppingListETagTest(TestCase):
+    """ETag списка покупок меняется вместе с текстом файла."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='buyer', email='buyer@example.com', password='password'
+        )
+        self.ingredient = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        recipe = Recipe.objects.create(
+            author=self.user, name='блины', image='images/recipe.png',
+            text='текст', cooking_time=10
+        )
+        RecipeIngredient.objects.create(
+            recipes=recipe, ingredients=self.ingredient, amount=200
+        )
+        ShoppingCart.objects.create(user=self.user, recipes=recipe)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, **headers):
+        return self.client.get('/api/recipes/download_shopping_cart/',
+                               **headers)
+
+    def test_not_modified(self):
+        etag = self.download()['ETag']
+        self.assertEqual(self.download(HTTP_IF_NONE_MATCH=etag).status_code,
+                         304)
+
+    def test_ingredient_rename_changes_etag(self):
+        etag = self.download()['ETag']
+        self.ingredient.measurement_unit = 'кг'
+        self.ingredient.save()
+        response = self.download(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('кг', b''.join(response.streaming_content).decode())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeETagTest(TestCase):
+    """ETag рецептов меняется вместе с содержимым ответа."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            username='chef', email='chef@example.com', password='password',
+            first_name='Иван'
+        )
+        self.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        self.recipes = []
+        for index in range(3):
+            recipe = Recipe.objects.create(
+                author=self.author, name=f'рецепт {index}',
+                image='images/recipe.png', text='текст', cooking_time=10
+            )
+            RecipeIngredient.objects.create(
+                recipes=recipe, ingredients=self.ingredient, amount=5
+            )
+            self.recipes.append(recipe)
+        self.client = APIClient()
+
+    def assert_changed(self, url, change):
+        response = self.client.get(url)
+        self.assertEqual(
+            self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag']
+            ).status_code,
+            304
+        )
+        change()
+        self.assertEqual(
+            self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag']
+            ).status_code,
+            200
+        )
+
+    def test_list_has_no_last_modified(self):
+        self.assertNotIn('Last-Modified',
+                         self.client.get('/api/recipes/?limit=1'))
+
+    def test_delete_on_other_page(self):
+        self.assert_changed('/api/recipes/?limit=1&page=1',
+                            self.recipes[0].delete)
+
+    def test_ingredient_rename(self):
+        def rename():
+            self.ingredient.name = 'морская соль'
+            self.ingredient.save()
+
+        self.assert_changed(f'/api/recipes/{self.recipes[0].pk}/', rename)
+
+    def test_author_rename(self):
+        def rename():
+            self.author.first_name = 'Пётр'
+            self.author.save()
+
+        self.assert_changed(f'/api/recipes/{self.recipes[0].pk}/', rename)
+        self.assertEqual(
+            self.client.get(
+                f'/api/recipes/{self.recipes[0].pk}/'
+            ).json()['author']['first_name'],
+            'Пётр'
+        )
+
+
+@skipUnlessDBFeature('has_select_for_update')
+@override_settings(CACHES=TEST_CACHES)
+class ConcurrentListTest(TransactionTestCase):
+    """Параллельные запросы меняют счётчики и список покупок ровно один раз."""
+
+    THREADS = 4
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='racer', email='racer@example.com', password='password'
+        )
+        self.ingredient = Ingredient.objects.create(
+            name='сахар', measurement_unit='г'
+        )
+        self.recipes = []
+        for index in range(3):
+            recipe = Recipe.objects.create(
+                author=self.user, name=f'рецепт {index}',
+                image='images/recipe.png', text='текст', cooking_time=10
+            )
+            RecipeIngredient.objects.create(
+                recipes=recipe, ingredients=self.ingredient, amount=100
+            )
+            self.recipes.append(recipe)
+        self.recipe_ids = [recipe.pk for recipe in self.recipes]
+
+    def run_concurrently(self, method, url, data=None):
+        barrier = Barrier(self.THREADS)
+        responses = []
+
+        def request():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                barrier.wait()
+                responses.append(
+                    getattr(client, method)(url, data, format='json')
+                )
+            finally:
+                connection.close()
+
+        threads = [Thread(target=request) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(responses), self.THREADS)
+        return responses
+
+    def statuses(self, responses, status):
+        return sorted(
+            result['id']
+            for response in responses
+            for result in response.json()['results']
+            if result['status'] == status
+        )
+
+    def favorites_counts(self):
+        return list(Recipe.objects.filter(
+            pk__in=self.recipe_ids
+        ).order_by('pk').values_list('favorites_count', flat=True))
+
+    def shopping_list_amount(self):
+        item = ShoppingListItem.objects.filter(user=self.user).first()
+        return item.amount if item is not None else None
+
+    def test_bulk_add_favorites(self):
+        responses = self.run_concurrently(
+            'post', '/api/recipes/favorite/bulk/',
+            {'recipes': self.recipe_ids}
+        )
+        self.assertEqual(self.statuses(responses, 'created'), self.recipe_ids)
+        self.assertEqual(self.favorites_counts(), [1, 1, 1])
+
+    def test_bulk_add_shopping_cart(self):
+        responses = self.run_concurrently(
+            'post', '/api/recipes/shopping_cart/bulk/',
+            {'recipes': self.recipe_ids}
+        )
+        self.assertEqual(self.statuses(responses, 'created'), self.recipe_ids)
+        self.assertEqual(self.shopping_list_amount(), 300)
+
+    def test_remove_favorite(self):
+        recipe = self.recipes[0]
+        other = User.objects.create_user(
+            username='other', email='other@example.com', password='password'
+        )
+        Favorite.objects.add_recipes(other.pk, [recipe.pk])
+        Favorite.objects.add_recipes(self.user.pk, [recipe.pk])
+        responses = self.run_concurrently(
+            'delete', f'/api/recipes/{recipe.pk}/favorite/'
+        )
+        self.assertEqual(
+            sorted(response.status_code for response in responses),
+            [204, 404, 404, 404]
+        )
+        self.assertEqual(self.favorites_counts(), [1, 0, 0])
+
+    def test_remove_shopping_cart(self):
+        ShoppingCart.objects.add_recipes(self.user.pk, self.recipe_ids)
+        self.assertEqual(self.shopping_list_amount(), 300)
+        recipe = self.recipes[0]
+        responses = self.run_concurrently(
+            'delete', f'/api/recipes/{recipe.pk}/shopping_cart/'
+        )
+        self.assertEqual(
+            sorted(response.status_code for response in responses),
+            [204, 404, 404, 404]
+        )
+        self.assertEqual(self.shopping_list_amount(), 200)
+
+    def test_add_and_remove_shopping_cart(self):
+        recipe = self.recipes[0]
+        self.run_concurrently(
+            'post', f'/api/recipes/{recipe.pk}/shopping_cart/'
+        )
+        self.assertEqual(self.shopping_list_amount(), 100)
+        self.run_concurrently(
+            'delete', f'/api/recipes/{recipe.pk}/shopping_cart/'
+        )
+        self.assertIsNone(self.shopping_list_amount())
+
+    def test_follow_and_unfollow(self):
+        author = User.objects.create_user(
+            username='author', email='author@example.com', password='password'
+        )
+        other = User.objects.create_user(
+            username='other', email='other@example.com', password='password'
+        )
+        Follow.objects.create(user=other, following=author)
+        url = f'/api/users/{author.pk}/subscribe/'
+        responses = self.run_concurrently('post', url)
+        self.assertEqual(
+            sorted(response.status_code for response in responses),
+            [201, 400, 400, 400]
+        )
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 2)
+        responses = self.run_concurrently('delete', url)
+        self.assertEqual(
+            sorted(response.status_code for response in responses),
+            [204, 404, 404, 404]
+        )
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 1)
+        self.assertFalse(Follow.objects.filter(
+            user=self.user, following=author
+        ).exists())
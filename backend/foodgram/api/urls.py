@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .async_views import pool_routes
 from .views import IngredientViewSet, RecipeViewSet, TagViewSet
 
 router = DefaultRouter()
@@ -31,8 +33,12 @@ router.register(
     basename='ingredients'
 )
 
+router_urls = router.urls
+if settings.ASYNC_VIEWS:
+    router_urls = pool_routes(router_urls)
+
 urlpatterns = [
-    path('', include(router.urls)),
+    path('', include(router_urls)),
     path('', include('users.urls')),
     path('auth/', include('djoser.urls.authtoken')),
 ]
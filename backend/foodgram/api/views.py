@@ -1,21 +1,39 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
+from recipes import fulltext
+from recipes.cache import tag_cache
+from recipes.fragments import recipe_fragments
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            ShoppingCart, Tag, TimelineEntry)
+from recipes.relations import favorite_ids, following_ids, shopping_cart_ids
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import (IsAuthenticated,
-                                        IsAuthenticatedOrReadOnly)
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from .filters import CustomSearchFilter, RecipeFilter
-from .pagination import RecipeResultSetPagination
+from .exporters import (EXPORTERS, ExportContentNegotiation,
+                        shopping_list_etag, shopping_list_rows)
+from .filters import IngredientSearchFilter, RecipeFilter
+from .pagination import (CursorPaginationMixin, RecipeCursorPagination,
+                         RecipeResultSetPagination, TimelinePagination)
 from .permissions import AdminAuthorPermission, IsAdminUserOrReadOnly
-from .serializers import (AllIngredientsSerializer, FavoriteSerializer,
+from .serializers import (AllIngredientsSerializer, RecipeMiniSerializer,
                           RecipeReadSerializer, RecipeWriteSerializer,
-                          ShopSerializer, TagSerializer)
+                          TagSerializer)
+
+User = get_user_model()
+
+NO_FLAGS = (False, False, False)
 
 
 class TagViewSet(viewsets.ModelViewSet):
@@ -26,104 +44,349 @@ class TagViewSet(viewsets.ModelViewSet):
     permission_classes = (IsAdminUserOrReadOnly,)
     lookup_field = 'slug'
 
+    def cached_response(self, request, get_data):
+        version, tags = tag_cache.snapshot()
+        etag = quote_etag(f'tags-{version}')
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        response = Response(get_data(tags))
+        response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request,
+            lambda tags: self.get_serializer(tags, many=True).data
+        )
 
-class RecipeViewSet(viewsets.ModelViewSet):
+    def retrieve(self, request, *args, **kwargs):
+        def get_data(tags):
+            for tag in tags:
+                if tag.slug == kwargs[self.lookup_field]:
+                    return self.get_serializer(tag).data
+            raise NotFound()
+        return self.cached_response(request, get_data)
+
+
+class RecipeViewSet(CursorPaginationMixin, viewsets.ModelViewSet):
     """Вьюсет для рецептов и скачивании списка покупок."""
 
     def get_serializer_class(self):
-        if self.request.method in ('POST', 'PATCH'):
+        if self.request.method in ('POST', 'PUT', 'PATCH'):
             return RecipeWriteSerializer
         return RecipeReadSerializer
 
     queryset = Recipe.objects.all()
-    permission_classes = (IsAuthenticatedOrReadOnly,)
+    permission_classes = (AdminAuthorPermission,)
     pagination_class = RecipeResultSetPagination
+    cursor_pagination_class = RecipeCursorPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
-    @action(methods=['patch', 'delete'], detail=False,
-            permission_classes=(AdminAuthorPermission,),)
-    def delete(self, request, **kwargs):
-        recipe_id = self.kwargs.get('recipes_id')
-        recipes = get_object_or_404(Recipe, pk=recipe_id)
-        recipes.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
-
-    def patch(self):
-        recipe_id = self.kwargs.get('recipes_id')
-        recipes = get_object_or_404(Recipe, pk=recipe_id)
-        serializer = RecipeWriteSerializer(recipes)
-        serializer.is_valid(raise_exception=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    def get_queryset(self):
+        if self.action in ('update', 'partial_update', 'destroy'):
+            return Recipe.objects.all()
+        return Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredients'
+                )
+            )
+        )
+
+    def get_validator_queryset(self):
+        return Recipe.objects.only('id', 'author', 'pub_date', 'updated_at')
+
+    def get_flags(self, recipes):
+        """Персональные флаги рецептов из наборов id пользователя."""
+        user = self.request.user
+        if user.is_anonymous:
+            return {}
+        favorites = favorite_ids.get(user.pk)
+        shopping_cart = shopping_cart_ids.get(user.pk)
+        following = following_ids.get(user.pk)
+        return {
+            recipe.pk: (
+                recipe.pk in favorites,
+                recipe.pk in shopping_cart,
+                recipe.author_id in following
+            )
+            for recipe in recipes
+        }
+
+    def get_page_state(self, page):
+        """count и ссылки страницы: они меняются и без правки её рецептов."""
+        if page is None:
+            return ()
+        paginator = getattr(getattr(self.paginator, 'page', None),
+                            'paginator', None)
+        return (
+            paginator.count if paginator is not None else None,
+            self.paginator.get_next_link(),
+            self.paginator.get_previous_link(),
+        )
+
+    def get_validators(self, recipes, flags, page_state=None):
+        """ETag и Last-Modified по версиям рецептов и флагам пользователя.
+
+        Для списков Last-Modified не отдаётся: время изменения рецептов
+        страницы не отражает удаление рецептов с других страниц.
+        """
+        user = self.request.user
+        digest = hashlib.md5(f'{user.pk}:{tag_cache.version()}'.encode())
+        if page_state is not None:
+            digest.update(repr(page_state).encode())
+        last_modified = None
+        for recipe in recipes:
+            favorited, in_shopping_cart, subscribed = flags.get(
+                recipe.pk, NO_FLAGS
+            )
+            digest.update((
+                f'{recipe.pk}:{recipe.updated_at.isoformat()}:'
+                f'{favorited:d}{in_shopping_cart:d}{subscribed:d};'
+            ).encode())
+            if page_state is None and (
+                last_modified is None or recipe.updated_at > last_modified
+            ):
+                last_modified = recipe.updated_at
+        return quote_etag(digest.hexdigest()), last_modified
+
+    def conditional_response(self, recipes, get_response, page_state=None):
+        flags = self.get_flags(recipes)
+        etag, last_modified = self.get_validators(recipes, flags, page_state)
+        request = self.request
+        not_modified = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=(
+                None if last_modified is None or request.user.is_authenticated
+                else int(last_modified.timestamp())
+            )
+        )
+        if not_modified is not None:
+            return not_modified
+        response = get_response(flags)
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.recipes_response(
+            self.filter_queryset(self.get_validator_queryset())
+        )
+
+    @action(detail=False, url_path='search', cursor_pagination_class=None)
+    def search(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {'q': 'Введите поисковый запрос.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return self.recipes_response(fulltext.search(
+            self.filter_queryset(self.get_validator_queryset()), query
+        ))
 
     @action(detail=False, permission_classes=(IsAuthenticated,),
-            url_path='download_shopping_cart')
+            url_path='timeline')
+    def timeline(self, request):
+        recipes = self.filter_queryset(Recipe.objects.all())
+        if not recipes.query.has_filters():
+            recipes = None
+        paginator = TimelinePagination()
+        rows = paginator.paginate_rows(
+            lambda before, limit: TimelineEntry.objects.page(
+                request.user.pk, limit, before, recipes
+            ),
+            request
+        )
+        loaded = self.get_validator_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in rows]
+        )
+        page = [loaded[recipe_id] for recipe_id, _ in rows
+                if recipe_id in loaded]
+
+        def get_response(flags):
+            return paginator.get_paginated_response(
+                self.recipes_data(page, flags)
+            )
+
+        return self.conditional_response(
+            page, get_response, (paginator.get_next_link(),)
+        )
+
+    def render_fragments(self, recipe_ids):
+        loaded = self.get_queryset().in_bulk(recipe_ids)
+        serializer = RecipeReadSerializer(
+            list(loaded.values()), many=True, context={'request': None}
+        )
+        return {
+            recipe.pk: (recipe.updated_at, data)
+            for recipe, data in zip(loaded.values(), serializer.data)
+        }
+
+    def personalize(self, data, flags):
+        if flags is None:
+            return data
+        favorited, in_shopping_cart, subscribed = flags
+        return {
+            **data,
+            'author': {**data['author'], 'is_subscribed': subscribed},
+            'is_favorited': favorited,
+            'is_in_shopping_cart': in_shopping_cart,
+        }
+
+    def recipes_data(self, recipes, flags):
+        fragments = recipe_fragments.get_many(recipes, self.render_fragments)
+        return [
+            self.personalize(fragments[recipe.pk], flags.get(recipe.pk))
+            for recipe in recipes if recipe.pk in fragments
+        ]
+
+    def recipes_response(self, queryset):
+        page = self.paginate_queryset(queryset)
+        recipes = list(queryset) if page is None else page
+
+        def get_response(flags):
+            data = self.recipes_data(recipes, flags)
+            if page is None:
+                return Response(data)
+            return self.get_paginated_response(data)
+
+        return self.conditional_response(
+            recipes, get_response, self.get_page_state(page)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = get_object_or_404(
+            self.get_validator_queryset(), pk=kwargs[self.lookup_field]
+        )
+        self.check_object_permissions(request, recipe)
+
+        def get_response(flags):
+            data = self.recipes_data([recipe], flags)
+            if not data:
+                raise NotFound()
+            return Response(data[0])
+
+        return self.conditional_response([recipe], get_response)
+
+    @action(detail=False, permission_classes=(IsAuthenticated,),
+            url_path='download_shopping_cart',
+            content_negotiation_class=ExportContentNegotiation)
     def download_shopping_cart(self, request):
-        responce = HttpResponse(content_type='text/plain')
-        responce['Content-Disposition'] = 'attachment; filename=shop.txt'
+        export_format = request.query_params.get('format', 'txt')
+        if export_format not in EXPORTERS:
+            return Response(
+                {'format': f'Доступные форматы: {", ".join(EXPORTERS)}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         user = request.user
-        ingredients = RecipeIngredient.objects.filter(
-            recipes__shop__user=user
-        ).values(
-            'ingredients_id__name',
-            'ingredients_id__measurement_unit'
-        ).annotate(Sum('amount'))
-        for ingredient in ingredients:
-            name = ingredient['ingredients_id__name'].capitalize()
-            measurement_unit = ingredient['ingredients_id__measurement_unit']
-            amount = ingredient['amount__sum']
-            responce.writelines(f'{name} ({measurement_unit}) - {amount} \n')
+        etag = shopping_list_etag(user, export_format)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        exporter, content_type = EXPORTERS[export_format]
+        responce = StreamingHttpResponse(
+            exporter(shopping_list_rows(user)),
+            content_type=content_type
+        )
+        responce['Content-Disposition'] = (
+            f'attachment; filename=shop.{export_format}'
+        )
+        responce['ETag'] = etag
+        patch_cache_control(responce, private=True, no_cache=True)
         return responce
 
+    def bulk_update_list(self, request, model):
+        recipe_ids = request.data.get('recipes')
+        if not isinstance(recipe_ids, list) or not all(
+            isinstance(pk, int) and not isinstance(pk, bool)
+            for pk in recipe_ids
+        ):
+            return Response(
+                {'recipes': 'Передайте список id рецептов.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        recipe_ids = list(dict.fromkeys(recipe_ids))
+        found = set(Recipe.objects.filter(
+            pk__in=recipe_ids
+        ).values_list('pk', flat=True))
+        found_ids = [pk for pk in recipe_ids if pk in found]
+        if request.method == 'DELETE':
+            changed = set(model.objects.remove_recipes(
+                request.user.pk, found_ids
+            ))
+            result, unchanged = 'deleted', 'missing'
+        else:
+            changed = set(model.objects.add_recipes(
+                request.user.pk, found_ids
+            ))
+            result, unchanged = 'created', 'exists'
+        return Response({'results': [
+            {
+                'id': pk,
+                'status': (
+                    'not_found' if pk not in found
+                    else result if pk in changed else unchanged
+                )
+            }
+            for pk in recipe_ids
+        ]})
+
+    @action(detail=False, permission_classes=(IsAuthenticated,),
+            url_path='favorite/bulk', methods=['post', 'delete'])
+    def favorite_bulk(self, request, **kwargs):
+        return self.bulk_update_list(request, Favorite)
+
+    @action(detail=False, permission_classes=(IsAuthenticated,),
+            url_path='shopping_cart/bulk', methods=['post', 'delete'])
+    def shopping_cart_bulk(self, request, **kwargs):
+        return self.bulk_update_list(request, ShoppingCart)
+
+    def toggle_list(self, request, model, message):
+        recipe = get_object_or_404(
+            Recipe.objects.only(
+                'id', 'name', 'image', 'image_variants', 'cooking_time'
+            ),
+            pk=self.kwargs.get('recipes_id')
+        )
+        if request.method == 'DELETE':
+            if not model.objects.remove_recipes(request.user.pk, [recipe.pk]):
+                raise NotFound()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if not model.objects.add_recipe(request.user.pk, recipe.pk):
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                message
+            ]})
+        return Response(
+            RecipeMiniSerializer(recipe).data,
+            status=status.HTTP_201_CREATED
+        )
+
     @action(detail=False, permission_classes=(IsAuthenticated,),
             url_path='favorite',
             url_name='favorite',
             methods=['delete', 'post']
             )
     def favorite(self, request, **kwargs):
-        if request.method == 'DELETE':
-            recipes_id = self.kwargs.get('recipes_id')
-            recipes = get_object_or_404(Recipe, pk=recipes_id)
-            author = request.user
-            favorite = get_object_or_404(
-                Favorite,
-                user=author,
-                recipes=recipes,
-            )
-            favorite.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-
-        recipes_id = self.kwargs.get('recipes_id')
-        recipes = get_object_or_404(Recipe, pk=recipes_id)
-        user = request.user
-        serializer = FavoriteSerializer(
-            data={'user': user.id, 'recipes': recipes.id})
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return self.toggle_list(
+            request, Favorite, 'Вы уже добавили в избранное.'
+        )
 
     @action(detail=False, permission_classes=(IsAuthenticated,),
             url_path='shopping_cart',
             url_name='shopping_cart',
             methods=['delete', 'post'])
     def shopping_cart(self, request, **kwargs):
-        if request.method == 'DELETE':
-            recipe_id = self.kwargs.get('recipes_id')
-            recipes = get_object_or_404(Recipe, pk=recipe_id)
-            author = request.user
-            cart = get_object_or_404(ShoppingCart, user=author,
-                                     recipes=recipes)
-            cart.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-
-        recipes_id = self.kwargs.get('recipes_id')
-        recipes = get_object_or_404(Recipe, pk=recipes_id)
-        user = request.user
-        serializer = ShopSerializer(
-            data={'user': user.id, 'recipes': recipes.id})
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return self.toggle_list(
+            request, ShoppingCart, 'Вы уже добавили в корзину.'
+        )
 
 
 class IngredientViewSet(viewsets.ModelViewSet):
@@ -132,5 +395,4 @@ class IngredientViewSet(viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = AllIngredientsSerializer
     permission_classes = (IsAdminUserOrReadOnly,)
-    filter_backends = (CustomSearchFilter,)
-    search_fields = ('^name',)
+    filter_backends = (IngredientSearchFilter,)
@@ -0,0 +1,12 @@
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+
+django.setup(set_prefix=False)
+
+from api.async_views import PooledASGIHandler  # noqa: E402
+
+application = PooledASGIHandler()
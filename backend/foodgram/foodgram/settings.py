@@ -77,6 +77,22 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(BASE_DIR,
+                                                             'cache')),
+    }
+}
+
+if 'memcached' not in CACHES['default']['BACKEND']:
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000)),
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -110,12 +126,41 @@ MEDIA_URL = 'http://158.160.0.12/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+
+RECIPE_IMAGE_MAX_PIXELS = 40_000_000
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+ASYNC_VIEWS = (os.getenv('ASYNC_VIEWS', 'False') == 'True')
+
+ASYNC_DB_WORKERS = int(os.getenv('ASYNC_DB_WORKERS', 8))
+
+ASYNC_STREAM_WORKERS = int(os.getenv('ASYNC_STREAM_WORKERS', 4))
+
+RELATION_CACHE_USERS = int(os.getenv('RELATION_CACHE_USERS', 10000))
+
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', 300))
+
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10000))
+
+TIMELINE_FANOUT_LIMIT = int(os.getenv('TIMELINE_FANOUT_LIMIT', 10000))
+
+TIMELINE_BATCH_SIZE = 1000
+
+TIMELINE_BACKFILL_SIZE = 100
+
+INGREDIENT_INDEX_PATH = os.getenv(
+    'INGREDIENT_INDEX_PATH',
+    os.path.join(BASE_DIR, 'data', 'ingredients.idx')
+)
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
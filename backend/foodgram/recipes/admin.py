@@ -1,47 +1,95 @@
+from api.pagination import ApproximateCountPaginator
 from django.contrib import admin
 
-from .models import (Favorite, Follow, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
+from .models import (Favorite, Follow, Ingredient, MediaBlob, Recipe,
+                     RecipeIngredient, ShoppingCart, ShoppingListItem, Tag,
+                     TimelineEntry)
 
 
-@admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class ScalableModelAdmin(admin.ModelAdmin):
+    """Админка без полного подсчёта строк таблицы."""
+
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
 
-    def favorite_count(self, obj):
-        return obj.favorite.count()
+class RecipeIngredientInline(admin.TabularInline):
+    model = RecipeIngredient
+    autocomplete_fields = ('ingredients',)
+    extra = 0
 
-    favorite_count.short_description = 'Добавлено в избранное'
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'recipes__author', 'ingredients'
+        )
 
-    list_display = ('name', 'author')
-    readonly_fields = ('favorite_count',)
-    list_filter = ('author', 'name', 'tags',)
+
+@admin.register(Recipe)
+class RecipeAdmin(ScalableModelAdmin):
+    list_display = ('name', 'author', 'favorites_count', 'pub_date')
+    list_select_related = ('author',)
+    list_filter = ('tags',)
+    search_fields = ('name',)
+    autocomplete_fields = ('author', 'tags')
+    readonly_fields = ('favorites_count',)
+    inlines = (RecipeIngredientInline,)
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
-    list_filter = ('name',)
+class IngredientAdmin(ScalableModelAdmin):
+    list_display = ('name', 'measurement_unit')
+    search_fields = ('name',)
 
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
-    pass
+    list_display = ('name', 'slug', 'color')
+    search_fields = ('name', 'slug')
 
 
 @admin.register(RecipeIngredient)
-class RecipeIngredientAdmin(admin.ModelAdmin):
-    pass
+class RecipeIngredientAdmin(ScalableModelAdmin):
+    list_display = ('recipes', 'ingredients', 'amount')
+    list_select_related = ('recipes__author', 'ingredients')
+    autocomplete_fields = ('recipes', 'ingredients')
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
-    pass
+class FavoriteAdmin(ScalableModelAdmin):
+    list_display = ('user', 'recipes', 'pub_date')
+    list_select_related = ('user', 'recipes__author')
+    autocomplete_fields = ('user', 'recipes')
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
-    pass
+class FollowAdmin(ScalableModelAdmin):
+    list_display = ('user', 'following')
+    list_select_related = ('user', 'following')
+    autocomplete_fields = ('user', 'following')
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
-    pass
+class ShoppingCartAdmin(ScalableModelAdmin):
+    list_display = ('user', 'recipes', 'pub_date')
+    list_select_related = ('user', 'recipes__author')
+    autocomplete_fields = ('user', 'recipes')
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(ScalableModelAdmin):
+    list_display = ('user', 'ingredients', 'amount')
+    list_select_related = ('user', 'ingredients')
+    autocomplete_fields = ('user', 'ingredients')
+
+
+@admin.register(TimelineEntry)
+class TimelineEntryAdmin(ScalableModelAdmin):
+    list_display = ('user', 'recipe', 'pub_date')
+    list_select_related = ('user', 'recipe__author')
+    autocomplete_fields = ('user', 'recipe')
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(ScalableModelAdmin):
+    list_display = ('name', 'references')
+    search_fields = ('name',)
@@ -0,0 +1,46 @@
+from uuid import uuid4
+
+from django.core.cache import cache
+
+from .models import Tag
+
+
+class ReferenceCache:
+    """Копия небольшой справочной таблицы в памяти процесса.
+
+    Версия таблицы хранится в общем кэше Django и меняется сигналами при
+    каждом изменении, поэтому все воркеры сбрасывают свою копию при первом
+    же запросе после изменения.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._snapshot = (None, [])
+
+    @property
+    def version_key(self):
+        return f'reference-version:{self.model._meta.label_lower}'
+
+    def version(self):
+        version = cache.get(self.version_key)
+        if version is not None:
+            return version
+        cache.add(self.version_key, uuid4().hex, None)
+        return cache.get(self.version_key)
+
+    def bump(self):
+        cache.set(self.version_key, uuid4().hex, None)
+
+    def snapshot(self):
+        version = self.version()
+        cached_version, objects = self._snapshot
+        if cached_version != version:
+            objects = list(self.model.objects.all())
+            self._snapshot = (version, objects)
+        return version, objects
+
+    def all(self):
+        return self.snapshot()[1]
+
+
+tag_cache = ReferenceCache(Tag)
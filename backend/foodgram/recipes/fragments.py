@@ -0,0 +1,59 @@
+from django.core.cache import cache
+
+from .cache import tag_cache
+
+FRAGMENT_TIMEOUT = 24 * 60 * 60
+
+
+def fragment_key(recipe_id):
+    return f'recipe-fragment:{recipe_id}'
+
+
+def fragment_version(updated_at, tags_version):
+    return f'{updated_at.isoformat()}:{tags_version}'
+
+
+class RecipeFragmentCache:
+    """Общие для всех пользователей части ответа по рецептам.
+
+    Фрагмент хранится вместе с версией — временем изменения рецепта и
+    версией тегов. Сигналы обновляют время изменения рецепта и при правке
+    его ингредиентов или автора, так что старый фрагмент становится
+    недействительным без явного удаления.
+    """
+
+    def get_many(self, recipes, render):
+        """Фрагменты рецептов по id; недостающие строит render(ids)."""
+        tags_version = tag_cache.version()
+        cached = cache.get_many(
+            [fragment_key(recipe.pk) for recipe in recipes]
+        )
+        fragments = {}
+        missing = []
+        for recipe in recipes:
+            version, data = cached.get(fragment_key(recipe.pk), (None, None))
+            if version == fragment_version(recipe.updated_at, tags_version):
+                fragments[recipe.pk] = data
+            else:
+                missing.append(recipe.pk)
+        if missing:
+            rendered = render(missing)
+            cache.set_many(
+                {
+                    fragment_key(pk): (
+                        fragment_version(updated_at, tags_version), data
+                    )
+                    for pk, (updated_at, data) in rendered.items()
+                },
+                FRAGMENT_TIMEOUT
+            )
+            fragments.update(
+                (pk, data) for pk, (_, data) in rendered.items()
+            )
+        return fragments
+
+    def invalidate(self, recipe_ids):
+        cache.delete_many([fragment_key(pk) for pk in recipe_ids])
+
+
+recipe_fragments = RecipeFragmentCache()
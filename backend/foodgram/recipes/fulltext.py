@@ -0,0 +1,133 @@
+import re
+
+from django.db import connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .ingredient_index import fold
+
+SEARCH_TABLE = 'recipes_recipe_search'
+BATCH_SIZE = 500
+
+DOCUMENTS_SQL = (
+    'FROM recipes_recipe r '
+    'LEFT JOIN recipes_recipeingredient ri ON ri.recipes_id = r.id '
+    'LEFT JOIN recipes_ingredient i ON i.id = ri.ingredients_id '
+    '{where} GROUP BY r.id, r.name, r.text'
+)
+
+POSTGRESQL = {
+    'index': (
+        f'INSERT INTO {SEARCH_TABLE} (recipe_id, document) '
+        "SELECT r.id, setweight(to_tsvector('russian', r.name), 'A') || "
+        "setweight(to_tsvector('russian', "
+        "coalesce(string_agg(i.name, ' '), '')), 'B') || "
+        "setweight(to_tsvector('russian', r.text), 'C') "
+        f'{DOCUMENTS_SQL} '
+        'ON CONFLICT (recipe_id) DO UPDATE SET document = EXCLUDED.document'
+    ),
+    'remove': f'DELETE FROM {SEARCH_TABLE} WHERE recipe_id IN ({{ids}})',
+    'match': (
+        f'SELECT recipe_id FROM {SEARCH_TABLE} '
+        "WHERE document @@ plainto_tsquery('russian', %s)"
+    ),
+    'rank': (
+        f"SELECT ts_rank(document, plainto_tsquery('russian', %s)) "
+        f'FROM {SEARCH_TABLE} WHERE recipe_id = recipes_recipe.id'
+    ),
+}
+
+SQLITE = {
+    'index': (
+        f'INSERT INTO {SEARCH_TABLE} (rowid, name, ingredients, text) '
+        "SELECT r.id, replace(replace(r.name, 'ё', 'е'), 'Ё', 'Е'), "
+        "replace(replace(coalesce(group_concat(i.name, ' '), ''), "
+        "'ё', 'е'), 'Ё', 'Е'), "
+        "replace(replace(r.text, 'ё', 'е'), 'Ё', 'Е') "
+        f'{DOCUMENTS_SQL}'
+    ),
+    'remove': f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({{ids}})',
+    'match': (
+        f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s'
+    ),
+    'rank': (
+        f'SELECT -bm25({SEARCH_TABLE}, 10.0, 5.0, 1.0) FROM {SEARCH_TABLE} '
+        f'WHERE {SEARCH_TABLE} MATCH %s AND rowid = recipes_recipe.id'
+    ),
+}
+
+BACKENDS = {
+    'postgresql': POSTGRESQL,
+    'sqlite': SQLITE,
+}
+
+
+def get_backend(using=None):
+    vendor = (connections[using] if using else connection).vendor
+    return BACKENDS.get(vendor)
+
+
+def remove_recipes(recipe_ids):
+    backend = get_backend()
+    recipe_ids = list(recipe_ids)
+    if backend is None or not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        for start in range(0, len(recipe_ids), BATCH_SIZE):
+            batch = recipe_ids[start:start + BATCH_SIZE]
+            cursor.execute(
+                backend['remove'].format(ids=', '.join(['%s'] * len(batch))),
+                batch
+            )
+
+
+def index_recipes(recipe_ids):
+    """Пересчитывает поисковые документы рецептов."""
+    backend = get_backend()
+    recipe_ids = list(recipe_ids)
+    if backend is None or not recipe_ids:
+        return
+    if backend is SQLITE:
+        remove_recipes(recipe_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(recipe_ids), BATCH_SIZE):
+            batch = recipe_ids[start:start + BATCH_SIZE]
+            cursor.execute(
+                backend['index'].format(where='WHERE r.id IN ({})'.format(
+                    ', '.join(['%s'] * len(batch))
+                )),
+                batch
+            )
+
+
+def rebuild_index():
+    backend = get_backend()
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(backend['index'].format(where=''))
+
+
+def search_query(backend, query):
+    if backend is POSTGRESQL:
+        return query
+    words = re.findall(r'\w+', fold(query))
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search(queryset, query):
+    """Оставляет рецепты, подходящие под запрос, лучшие — первыми."""
+    backend = get_backend(queryset.db)
+    if backend is None:
+        return queryset.filter(
+            Q(name__icontains=query) | Q(text__icontains=query)
+        )
+    query = search_query(backend, query)
+    if not query:
+        return queryset.none()
+    return queryset.filter(
+        pk__in=RawSQL(backend['match'], (query,))
+    ).annotate(
+        search_rank=RawSQL(backend['rank'], (query,))
+    ).order_by('-search_rank', '-pub_date', '-id')
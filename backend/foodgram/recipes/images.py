@@ -0,0 +1,114 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+VARIANT_WIDTHS = {
+    'small': 320,
+    'medium': 640,
+}
+VARIANT_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.IMAGE_WORKERS,
+        thread_name_prefix='recipe-images'
+    )
+
+
+def variant_name(name, size, extension):
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'variants', f'{stem}_{size}.{extension}')
+
+
+def render_variant(image, width, image_format):
+    variant = image.copy()
+    variant.thumbnail((width, width))
+    if image_format == 'JPEG' and variant.mode != 'RGB':
+        background = Image.new('RGB', variant.size, 'white')
+        background.paste(variant, mask=variant.getchannel('A'))
+        variant = background
+    buffer = BytesIO()
+    variant.save(buffer, image_format, quality=80)
+    return ContentFile(buffer.getvalue())
+
+
+def build_variants(recipe_id):
+    """Создаёт уменьшенные копии картинки рецепта."""
+    from .models import Recipe
+
+    try:
+        recipe = Recipe.objects.only('image').filter(pk=recipe_id).first()
+        if recipe is None or not recipe.image:
+            return
+        with recipe.image.open('rb') as f:
+            image = Image.open(f)
+            image.draft('RGB', (max(VARIANT_WIDTHS.values()),) * 2)
+            image = ImageOps.exif_transpose(image)
+            image = image.convert('RGBA' if 'A' in image.getbands()
+                                  or image.mode == 'P' else 'RGB')
+        storage = recipe.image.storage
+        variants = {}
+        for size, width in VARIANT_WIDTHS.items():
+            for extension, image_format in VARIANT_FORMATS.items():
+                variants.setdefault(size, {})[extension] = storage.save(
+                    variant_name(recipe.image.name, size, extension),
+                    render_variant(image, width, image_format)
+                )
+        Recipe.objects.filter(pk=recipe_id, image=recipe.image.name).update(
+            image_variants=variants,
+            updated_at=timezone.now()
+        )
+    except Exception:
+        logger.exception(
+            'Не удалось создать уменьшенные копии картинки рецепта %s',
+            recipe_id
+        )
+    finally:
+        connection.close()
+
+
+def delete_image_files(name):
+    """Удаляет файл картинки вместе с её уменьшенными копиями."""
+    from .storage import recipe_image_storage
+
+    recipe_image_storage.delete(name)
+    for size in VARIANT_WIDTHS:
+        for extension in VARIANT_FORMATS:
+            recipe_image_storage.delete(variant_name(name, size, extension))
+
+
+def schedule_variants(recipe):
+    """Ставит обработку картинки в фоновый пул после коммита."""
+    recipe_id = recipe.pk
+    transaction.on_commit(
+        lambda: get_executor().submit(build_variants, recipe_id)
+    )
+
+
+def variant_urls(recipe, request=None):
+    storage = recipe.image.storage
+    urls = {}
+    for size, names in (recipe.image_variants or {}).items():
+        urls[size] = {}
+        for extension, name in names.items():
+            url = storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[size][extension] = url
+    return urls
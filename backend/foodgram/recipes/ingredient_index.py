@@ -0,0 +1,196 @@
+import mmap
+import os
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+MAGIC = b'FGIDX002'
+VERSION_SIZE = 32
+HEADER_SIZE = len(MAGIC) + VERSION_SIZE + 4
+VERSION_KEY = 'ingredient-index-version'
+OFFSET_SIZE = array('I').itemsize
+FIELD_SEPARATOR = b'\x1f'
+RECORD_SEPARATOR = b'\n'
+MIN_SUBSTRING_LENGTH = 2
+
+
+def clean(text):
+    return text.replace('\n', ' ').replace('\x1f', ' ')
+
+
+def fold(text):
+    """Приводит строку к виду для поиска без учёта регистра и буквы ё."""
+    return ' '.join(text.casefold().replace('ё', 'е').split())
+
+
+class _Keys:
+    """Последовательность ключей индекса для бинарного поиска."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return len(self.index.offsets)
+
+    def __getitem__(self, position):
+        start = self.index.offsets[position]
+        end = self.index.data.find(FIELD_SEPARATOR, start)
+        return self.index.data[start:end]
+
+
+class _Snapshot:
+    """Открытый снимок индекса, отображённый в память."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            stat = os.fstat(f.fileno())
+        self.stamp = (stat.st_ino, stat.st_mtime_ns)
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'Повреждён индекс ингредиентов: {path}')
+        self.version = self.data[
+            len(MAGIC):len(MAGIC) + VERSION_SIZE
+        ].decode()
+        count = int.from_bytes(
+            self.data[len(MAGIC) + VERSION_SIZE:HEADER_SIZE], 'little'
+        )
+        self.start = HEADER_SIZE + count * OFFSET_SIZE
+        self.offsets = array('I')
+        self.offsets.frombytes(self.data[HEADER_SIZE:self.start])
+
+    def record(self, offset):
+        end = self.data.find(RECORD_SEPARATOR, offset)
+        _, pk, name, measurement_unit = (
+            self.data[offset:end].decode().split('\x1f')
+        )
+        return {
+            'id': int(pk),
+            'name': name,
+            'measurement_unit': measurement_unit,
+        }
+
+    def search(self, query):
+        query = fold(query)
+        needle = query.encode()
+        keys = _Keys(self)
+        found = []
+        position = bisect_left(keys, needle)
+        while position < len(keys) and keys[position].startswith(needle):
+            found.append(self.offsets[position])
+            position += 1
+        prefixed = set(found)
+        hit = -1
+        if len(query) >= MIN_SUBSTRING_LENGTH:
+            hit = self.data.find(needle, self.start)
+        while hit != -1:
+            offset = self.data.rfind(RECORD_SEPARATOR, self.start, hit) + 1
+            offset = max(offset, self.start)
+            key_end = self.data.find(FIELD_SEPARATOR, offset)
+            if hit + len(needle) <= key_end and offset not in prefixed:
+                found.append(offset)
+            next_record = self.data.find(RECORD_SEPARATOR, hit) + 1
+            hit = self.data.find(needle, next_record)
+        return [self.record(offset) for offset in found]
+
+
+class IngredientIndex:
+    """Поисковый индекс ингредиентов, общий для всех процессов сервера.
+
+    Снимок хранится в файле и отображается в память, поэтому страницы
+    индекса делят между собой все воркеры gunicorn. Запись отсортирована
+    по нормализованному названию: совпадения по началу находятся бинарным
+    поиском, совпадения внутри названия - поиском подстроки по снимку.
+
+    В заголовке снимка записана версия справочника, прочитанная до выборки
+    ингредиентов. Изменения справочника меняют версию в общем кэше Django,
+    и снимок с другой версией пересобирается при следующем поиске.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return settings.INGREDIENT_INDEX_PATH
+
+    def version(self):
+        version = cache.get(VERSION_KEY)
+        if version is not None:
+            return version
+        cache.add(VERSION_KEY, uuid4().hex, None)
+        return cache.get(VERSION_KEY)
+
+    def build(self, version=None):
+        from .models import Ingredient
+
+        if version is None:
+            version = self.version()
+        records = sorted(
+            (fold(name).encode(), pk, name, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            ).iterator()
+        )
+        offsets = array('I')
+        chunks = []
+        size = 0
+        for key, pk, name, measurement_unit in records:
+            record = FIELD_SEPARATOR.join((
+                key,
+                str(pk).encode(),
+                clean(name).encode(),
+                clean(measurement_unit).encode(),
+            )) + RECORD_SEPARATOR
+            offsets.append(size)
+            chunks.append(record)
+            size += len(record)
+        start = HEADER_SIZE + len(offsets) * OFFSET_SIZE
+        offsets = array('I', (offset + start for offset in offsets))
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(descriptor, 'wb') as f:
+            f.write(MAGIC)
+            f.write(version.encode().ljust(VERSION_SIZE)[:VERSION_SIZE])
+            f.write(len(offsets).to_bytes(4, 'little'))
+            f.write(offsets.tobytes())
+            f.writelines(chunks)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, self.path)
+        return len(records)
+
+    def invalidate(self):
+        cache.set(VERSION_KEY, uuid4().hex, None)
+
+    def open(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if self._snapshot is None or self._snapshot.stamp != stamp:
+            self._snapshot = _Snapshot(self.path)
+        return self._snapshot
+
+    def snapshot(self):
+        version = self.version()
+        with self._lock:
+            snapshot = self.open()
+            if snapshot is not None and snapshot.version == version:
+                return snapshot
+            self.build(version)
+            return self.open()
+
+    def search(self, query):
+        if not fold(query):
+            return []
+        return self.snapshot().search(query)
+
+
+ingredient_index = IngredientIndex()
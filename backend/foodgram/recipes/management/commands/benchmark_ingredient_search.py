@@ -0,0 +1,60 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    """Замер задержки автодополнения ингредиентов."""
+
+    help = 'Сравнивает поиск ингредиентов по индексу и запросом к БД.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def sample_queries(self, count, seed):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        generator = random.Random(seed)
+        queries = []
+        for _ in range(count):
+            name = generator.choice(names)
+            queries.append(name[:generator.randint(1, min(len(name), 5))])
+        return queries
+
+    def measure(self, search, queries):
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            search(query)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return (
+            sum(timings) / len(timings),
+            timings[len(timings) // 2],
+            timings[int(len(timings) * 0.95)],
+        )
+
+    def handle(self, *args, **options):
+        queries = self.sample_queries(options['queries'], options['seed'])
+        if not queries:
+            self.stdout.write('Нет ингредиентов для замера.')
+            return
+        ingredient_index.build()
+        ingredient_index.search(queries[0])
+        results = {
+            'БД (istartswith)': self.measure(
+                lambda query: list(Ingredient.objects.filter(
+                    name__istartswith=query
+                ).values('id', 'name', 'measurement_unit')),
+                queries
+            ),
+            'Индекс': self.measure(ingredient_index.search, queries),
+        }
+        for title, (mean, median, p95) in results.items():
+            self.stdout.write(
+                f'{title}: среднее {mean:.3f} мс, '
+                f'медиана {median:.3f} мс, p95 {p95:.3f} мс'
+            )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from recipes.images import build_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Создание уменьшенных копий картинок рецептов."""
+
+    help = 'Создаёт уменьшенные копии картинок, у которых их ещё нет.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать копии для всех рецептов.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        count = 0
+        for recipe_id in recipes.values_list('id', flat=True).iterator():
+            build_variants(recipe_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {count}'
+        ))
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.models import TimelineEntry, User
+
+
+class Command(BaseCommand):
+    """Заполнение лент авторов, вернувшихся под TIMELINE_FANOUT_LIMIT."""
+
+    help = ('Раскладывает по лентам рецепты авторов, которые всё ещё '
+            'читаются при запросе, хотя подписчиков у них уже не больше '
+            'TIMELINE_FANOUT_LIMIT.')
+
+    def handle(self, *args, **options):
+        authors = User.objects.filter(
+            timeline_pulled=True,
+            followers_count__lte=settings.TIMELINE_FANOUT_LIMIT
+        ).values_list('id', flat=True)
+        count = 0
+        for author_id in authors.iterator():
+            TimelineEntry.objects.fill_author(author_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Заполнены ленты подписчиков авторов: {count}'
+        ))
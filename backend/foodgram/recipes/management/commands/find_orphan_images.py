@@ -0,0 +1,123 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.images import VARIANT_WIDTHS
+from recipes.models import MediaBlob
+from recipes.storage import DERIVED_DIRECTORY, recipe_image_storage
+
+IMAGES_DIRECTORY = 'images'
+SHARDS = [f'{index:02x}' for index in range(256)] + ['']
+STATE_FILE = '.orphan_images_scan.json'
+LOOKUP_BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    """Поиск файлов картинок, на которые не ссылается ни один рецепт."""
+
+    help = (
+        'Проверяет очередную порцию каталогов images/<xx>/ и продолжает '
+        'с места остановки при следующем запуске.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shards',
+            type=int,
+            default=16,
+            help='Сколько каталогов проверить за запуск.'
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=3600,
+            help='Не трогать файлы моложе указанного числа секунд.'
+        )
+        parser.add_argument('--delete', action='store_true')
+
+    def state_path(self):
+        return os.path.join(settings.MEDIA_ROOT, STATE_FILE)
+
+    def load_cursor(self):
+        try:
+            with open(self.state_path()) as f:
+                return json.load(f)['shard'] % len(SHARDS)
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def save_cursor(self, cursor):
+        path = self.state_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'shard': cursor}, f)
+        os.replace(path + '.tmp', path)
+
+    def shard_files(self, shard):
+        """Файлы каталога images/<xx>/; пустой shard — старые файлы."""
+        root = os.path.join(IMAGES_DIRECTORY, shard)
+        if not recipe_image_storage.exists(root):
+            return
+        if shard:
+            for path, _, files in os.walk(recipe_image_storage.path(root)):
+                relative = os.path.relpath(path, settings.MEDIA_ROOT)
+                for filename in files:
+                    yield os.path.join(relative, filename).replace(os.sep, '/')
+            return
+        for directory in (root, os.path.join(root, DERIVED_DIRECTORY)):
+            if recipe_image_storage.exists(directory):
+                for filename in recipe_image_storage.listdir(directory)[1]:
+                    yield os.path.join(directory, filename)
+
+    def source_stem(self, name):
+        directory, filename = os.path.split(name)
+        stem = os.path.splitext(filename)[0]
+        if os.path.basename(directory) != DERIVED_DIRECTORY:
+            return directory, stem
+        for size in VARIANT_WIDTHS:
+            if stem.endswith(f'_{size}'):
+                stem = stem[:-len(size) - 1]
+                break
+        return os.path.dirname(directory), stem
+
+    def find_orphans(self, shard, min_age):
+        names = list(self.shard_files(shard))
+        sources = [
+            name for name in names
+            if os.path.basename(os.path.dirname(name)) != DERIVED_DIRECTORY
+        ]
+        known = set()
+        for start in range(0, len(sources), LOOKUP_BATCH_SIZE):
+            for name in MediaBlob.objects.filter(
+                name__in=sources[start:start + LOOKUP_BATCH_SIZE]
+            ).values_list('name', flat=True):
+                directory, filename = os.path.split(name)
+                known.add((directory, os.path.splitext(filename)[0]))
+        deadline = time.time() - min_age
+        orphans = []
+        for name in names:
+            if self.source_stem(name) in known:
+                continue
+            if os.path.getmtime(recipe_image_storage.path(name)) > deadline:
+                continue
+            orphans.append(name)
+        return orphans
+
+    def handle(self, *args, **options):
+        cursor = self.load_cursor()
+        count = min(max(options['shards'], 1), len(SHARDS))
+        found = 0
+        for step in range(count):
+            shard = SHARDS[(cursor + step) % len(SHARDS)]
+            for name in self.find_orphans(shard, options['min_age']):
+                found += 1
+                if options['delete']:
+                    recipe_image_storage.delete(name)
+                self.stdout.write(name)
+        self.save_cursor((cursor + count) % len(SHARDS))
+        action = 'Удалено' if options['delete'] else 'Найдено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов без ссылок: {found}, проверено каталогов: '
+            f'{count}, следующий: {(cursor + count) % len(SHARDS)}'
+        ))
@@ -1,18 +1,116 @@
 import csv
+import json
 import os.path
+import time
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.ingredient_index import ingredient_index
 from recipes.models import Ingredient
 
+READ_SIZE = 64 * 1024
+
+
+def read_csv(f):
+    for row in csv.reader(f, delimiter=','):
+        if len(row) >= 2 and row[0]:
+            yield row[0], row[1]
+
+
+def read_json(f):
+    """Читает массив (или поток) JSON-объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    while True:
+        chunk = f.read(READ_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in '[, \t\r\n':
+                position += 1
+            if position == len(buffer) or buffer[position] == ']':
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            if item.get('name'):
+                yield item['name'], item['measurement_unit']
+        if not chunk:
+            if buffer[position:].strip() not in ('', ']'):
+                raise CommandError('Некорректный JSON в файле ингредиентов.')
+            return
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
 
 class Command(BaseCommand):
-    """Экспорт из csv файлов в нашу базу данных."""
+    """Экспорт из csv и json файлов в нашу базу данных."""
+
+    help = 'Загружает ингредиенты пачками, пропуская уже существующие.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv')
+        )
+        parser.add_argument('--format', choices=READERS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Посчитать новые ингредиенты, ничего не записывая.'
+        )
 
     def handle(self, *args, **options):
-        with open(os.path.join(settings.BASE_DIR, 'data',
-                               'ingredients.csv'), 'r', encoding='UTF-8') as f:
-            csv_reader = csv.reader(f, delimiter=',')
-            for row in csv_reader:
-                Ingredient.objects.create(name=row[0],
-                                          measurement_unit=row[1])
+        path = options['path']
+        file_format = (
+            options['format'] or os.path.splitext(path)[1].lstrip('.')
+        )
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        dry_run = options['dry_run']
+        started = time.monotonic()
+        processed = created = 0
+        seen = set()
+        with open(path, 'r', encoding='UTF-8') as f, transaction.atomic():
+            rows = READERS[file_format](f)
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                processed += len(batch)
+                keys = [key for key in dict.fromkeys(batch) if key not in seen]
+                existing = set(Ingredient.objects.filter(
+                    name__in={name for name, _ in keys}
+                ).values_list('name', 'measurement_unit'))
+                keys = [key for key in keys if key not in existing]
+                if dry_run:
+                    seen.update(keys)
+                else:
+                    Ingredient.objects.bulk_create(
+                        [Ingredient(name=name, measurement_unit=unit)
+                         for name, unit in keys],
+                        ignore_conflicts=True
+                    )
+                created += len(keys)
+                rate = processed / max(time.monotonic() - started, 1e-6)
+                self.stdout.write(
+                    f'Обработано: {processed}, новых: {created}, '
+                    f'{rate:.0f} строк/с'
+                )
+        if not dry_run:
+            ingredient_index.invalidate()
+            ingredient_index.build()
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Будет добавлено" if dry_run else "Добавлено"} '
+            f'ингредиентов: {created} из {processed} строк за '
+            f'{time.monotonic() - started:.1f} с'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.fulltext import rebuild_index
+
+
+class Command(BaseCommand):
+    """Пересборка полнотекстового индекса рецептов."""
+
+    help = 'Заново строит поисковые документы для всех рецептов.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс пересобран.'))
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+from recipes.models import RecipeIngredient, ShoppingListItem
+
+
+class Command(BaseCommand):
+    """Пересборка или проверка итоговых списков покупок."""
+
+    help = 'Пересобирает таблицу итоговых списков покупок из корзин.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сравнить таблицу с корзинами, ничего не меняя.'
+        )
+
+    def expected_totals(self):
+        totals = RecipeIngredient.objects.filter(
+            recipes__shop__isnull=False
+        ).values(
+            'recipes__shop__user', 'ingredients'
+        ).annotate(total=Sum('amount'))
+        return {
+            (row['recipes__shop__user'], row['ingredients']): row['total']
+            for row in totals
+        }
+
+    def handle(self, *args, **options):
+        expected = self.expected_totals()
+        if options['check']:
+            stored = {
+                (user, ingredient): amount
+                for user, ingredient, amount
+                in ShoppingListItem.objects.values_list(
+                    'user', 'ingredients', 'amount'
+                )
+            }
+            mismatched = {
+                key for key in expected.keys() | stored.keys()
+                if expected.get(key) != stored.get(key)
+            }
+            if mismatched:
+                raise CommandError(
+                    f'Расхождений в списках покупок: {len(mismatched)}'
+                )
+            self.stdout.write(self.style.SUCCESS(
+                'Списки покупок совпадают с корзинами.'
+            ))
+            return
+        with transaction.atomic():
+            ShoppingListItem.objects.all().delete()
+            ShoppingListItem.objects.bulk_create(
+                [ShoppingListItem(user_id=user, ingredients_id=ingredient,
+                                  amount=amount)
+                 for (user, ingredient), amount in expected.items()],
+                batch_size=1000
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в списках покупок: {len(expected)}'
+        ))
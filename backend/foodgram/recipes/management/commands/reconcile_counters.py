@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Favorite, Follow, Recipe, User
+
+
+def count_of(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipes'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'following'),
+)
+
+
+class Command(BaseCommand):
+    """Сверка хранимых счётчиков избранного, рецептов и подписчиков."""
+
+    help = 'Пересчитывает счётчики там, где они разошлись с данными.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только посчитать расхождения, ничего не меняя.'
+        )
+
+    def handle(self, *args, **options):
+        drifted = 0
+        for model, field, related, related_field in COUNTERS:
+            stale = model.objects.alias(
+                expected=count_of(related, related_field)
+            ).exclude(**{field: F('expected')})
+            if options['check']:
+                count = stale.count()
+            else:
+                count = stale.update(
+                    **{field: count_of(related, related_field)}
+                )
+            drifted += count
+            self.stdout.write(
+                f'{model._meta.model_name}.{field}: расхождений {count}'
+            )
+        if options['check'] and drifted:
+            raise CommandError(f'Расхождений в счётчиках: {drifted}')
+        self.stdout.write(self.style.SUCCESS(
+            'Счётчики исправлены.' if drifted else 'Счётчики совпадают.'
+        ))
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.15 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+def merge_rows(model, field, keeper, duplicate):
+    """Переносит строки дубликата на оставляемый ингредиент."""
+    for row in model.objects.filter(ingredients_id=duplicate):
+        owner = getattr(row, field)
+        same = model.objects.filter(
+            ingredients_id=keeper, **{field: owner}
+        ).first()
+        if same is None:
+            row.ingredients_id = keeper
+            row.save(update_fields=['ingredients'])
+        else:
+            same.amount += row.amount
+            same.save(update_fields=['amount'])
+            row.delete()
+
+
+def remove_duplicates(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    groups = Ingredient.objects.values('name', 'measurement_unit').annotate(
+        keeper=models.Min('id'), total=models.Count('id')
+    ).filter(total__gt=1)
+    for group in groups:
+        duplicates = Ingredient.objects.filter(
+            name=group['name'],
+            measurement_unit=group['measurement_unit']
+        ).exclude(id=group['keeper']).values_list('id', flat=True)
+        for duplicate in list(duplicates):
+            merge_rows(RecipeIngredient, 'recipes_id', group['keeper'],
+                       duplicate)
+            merge_rows(ShoppingListItem, 'user_id', group['keeper'],
+                       duplicate)
+            Ingredient.objects.filter(id=duplicate).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='ingredient_unique'),
+        ),
+    ]
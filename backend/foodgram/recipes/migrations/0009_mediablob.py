@@ -0,0 +1,47 @@
+# Generated by Django 3.2.15 on 2026-10-18 16:46
+
+from django.db import migrations, models
+from django.db.models import Count
+import recipes.storage
+
+
+def register_images(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    MediaBlob = apps.get_model('recipes', 'MediaBlob')
+    images = (
+        Recipe.objects.exclude(image__isnull=True).exclude(image='')
+        .values('image').annotate(references=Count('id'))
+    )
+    MediaBlob.objects.bulk_create(
+        [MediaBlob(name=row['image'], references=row['references'])
+         for row in images.order_by()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Количество ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл картинки',
+                'verbose_name_plural': 'MediaBlob',
+            },
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, help_text='Загрузите картинку рецепта', null=True, storage=recipes.storage.ContentAddressedStorage(), upload_to='images/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(register_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.15 on 2026-10-18 16:49
+
+from django.db import migrations, models
+
+TAGS_MASK_SIZE = 63
+
+
+def fill_tags_mask(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    masks = {}
+    for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+        tag_id__lte=TAGS_MASK_SIZE
+    ).values_list('recipe_id', 'tag_id').iterator():
+        masks[recipe_id] = masks.get(recipe_id, 0) | 1 << (tag_id - 1)
+    Recipe.objects.bulk_update(
+        [Recipe(pk=pk, tags_mask=mask) for pk, mask in masks.items()],
+        ['tags_mask'],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_mediablob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Маска тегов'),
+        ),
+        migrations.RunPython(fill_tags_mask, migrations.RunPython.noop),
+    ]
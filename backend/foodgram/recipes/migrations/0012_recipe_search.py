@@ -0,0 +1,56 @@
+# Generated by Django 3.2.15 on 2026-10-18 17:05
+
+from django.db import migrations
+
+DOCUMENTS_SQL = (
+    'FROM recipes_recipe r '
+    'LEFT JOIN recipes_recipeingredient ri ON ri.recipes_id = r.id '
+    'LEFT JOIN recipes_ingredient i ON i.id = ri.ingredients_id '
+    'GROUP BY r.id, r.name, r.text'
+)
+
+CREATE_SQL = {
+    'postgresql': (
+        'CREATE TABLE recipes_recipe_search ('
+        'recipe_id integer PRIMARY KEY, document tsvector NOT NULL)',
+        'CREATE INDEX recipes_recipe_search_document_idx '
+        'ON recipes_recipe_search USING gin (document)',
+        'INSERT INTO recipes_recipe_search (recipe_id, document) '
+        "SELECT r.id, setweight(to_tsvector('russian', r.name), 'A') || "
+        "setweight(to_tsvector('russian', "
+        "coalesce(string_agg(i.name, ' '), '')), 'B') || "
+        "setweight(to_tsvector('russian', r.text), 'C') "
+        f'{DOCUMENTS_SQL}',
+    ),
+    'sqlite': (
+        'CREATE VIRTUAL TABLE recipes_recipe_search USING fts5('
+        "name, ingredients, text, tokenize='unicode61 remove_diacritics 2')",
+        'INSERT INTO recipes_recipe_search (rowid, name, ingredients, text) '
+        "SELECT r.id, replace(replace(r.name, 'ё', 'е'), 'Ё', 'Е'), "
+        "replace(replace(coalesce(group_concat(i.name, ' '), ''), "
+        "'ё', 'е'), 'Ё', 'Е'), "
+        "replace(replace(r.text, 'ё', 'е'), 'Ё', 'Е') "
+        f'{DOCUMENTS_SQL}',
+    ),
+}
+
+
+def create_search_index(apps, schema_editor):
+    for sql in CREATE_SQL.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_SQL:
+        schema_editor.execute('DROP TABLE IF EXISTS recipes_recipe_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
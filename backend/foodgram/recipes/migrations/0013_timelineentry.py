@@ -0,0 +1,59 @@
+# Generated by Django 3.2.15 on 2026-10-18 17:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    Follow = apps.get_model('recipes', 'Follow')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    TimelineEntry = apps.get_model('recipes', 'TimelineEntry')
+    follows = Follow.objects.filter(
+        following__followers_count__lte=settings.TIMELINE_FANOUT_LIMIT
+    ).values_list('user_id', 'following_id')
+    for user_id, author_id in follows.iterator():
+        recipes = Recipe.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-id'
+        ).values_list('pk', 'pub_date')[:settings.TIMELINE_BACKFILL_SIZE]
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                              pub_date=pub_date)
+                for recipe_id, pub_date in recipes
+            ],
+            ignore_conflicts=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0012_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Рецепт в ленте',
+                'verbose_name_plural': 'TimelineEntry',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='timeline_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='timeline_unique'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,40 @@
+import heapq
+import itertools
+import logging
+
 from colorfield.fields import ColorField
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Exists, F, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
 
+from .images import delete_image_files, get_executor
+from .storage import recipe_image_storage
 from .validators import validate_no_zero
 
 User = get_user_model()
 
+logger = logging.getLogger(__name__)
+
+TAGS_MASK_SIZE = 63
+
+
+def change_counter(queryset, field, delta):
+    """Атомарно меняет счётчик, не опуская его ниже нуля."""
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def tags_mask(tag_ids):
+    """Битовая маска тегов: бит id - 1 для тегов с id от 1 до 63."""
+    mask = 0
+    for tag_id in tag_ids:
+        if 0 < tag_id <= TAGS_MASK_SIZE:
+            mask |= 1 << (tag_id - 1)
+    return mask
+
 
 class Ingredient(models.Model):
     """Модель для создания таблицы ингредиентов."""
@@ -23,11 +52,46 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ingredients'
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'measurement_unit'],
+                                    name='ingredient_unique')]
 
     def __str__(self):
         return f'{self.name.capitalize()} ({self.measurement_unit})'
 
 
+class RecipeManager(models.Manager):
+    """Рецепты с выборкой последних рецептов нескольких авторов."""
+
+    def latest_by_author(self, author_ids, limit):
+        """{id автора: [рецепты]} — не больше limit свежих рецептов каждого.
+
+        В PostgreSQL на каждого автора выполняется LATERAL-подзапрос с
+        LIMIT, который читает recipe_author_pub_date_idx по диапазону.
+        В других СУБД используется коррелированный подзапрос.
+        """
+        if connection.vendor == 'postgresql':
+            table = connection.ops.quote_name(self.model._meta.db_table)
+            recipes = self.raw(
+                'SELECT recipe.* FROM unnest(%s::integer[]) AS author(id) '
+                f'CROSS JOIN LATERAL (SELECT * FROM {table} '
+                f'WHERE {table}.author_id = author.id '
+                'ORDER BY pub_date DESC LIMIT %s) AS recipe',
+                [list(author_ids), limit]
+            )
+        else:
+            recipes = self.filter(
+                author_id__in=author_ids,
+                pk__in=Subquery(self.filter(
+                    author=OuterRef('author')
+                ).order_by('-pub_date').values('pk')[:limit])
+            ).order_by('-pub_date')
+        by_author = {author_id: [] for author_id in author_ids}
+        for recipe in recipes:
+            by_author[recipe.author_id].append(recipe)
+        return by_author
+
+
 class Recipe(models.Model):
     """Модель для создания таблицы рецептов."""
 
@@ -42,9 +106,15 @@ class Recipe(models.Model):
         'Картинка',
         help_text='Загрузите картинку рецепта',
         upload_to='images/',
+        storage=recipe_image_storage,
         blank=True,
         null=True,
     )
+    image_variants = models.JSONField(
+        'Уменьшенные копии картинки',
+        default=dict,
+        blank=True,
+    )
     text = models.TextField(
         'Текст рецепта',
         help_text='Введите текст рецепта'
@@ -62,6 +132,11 @@ class Recipe(models.Model):
         help_text='Выберете теги',
         related_name='recipes',
     )
+    tags_mask = models.BigIntegerField(
+        'Маска тегов',
+        default=0,
+        editable=False,
+    )
     cooking_time = models.PositiveIntegerField(
         verbose_name='Время приготовления в минутах',
         validators=(validate_no_zero,)
@@ -70,16 +145,33 @@ class Recipe(models.Model):
         'Дата создания',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
+    favorites_count = models.PositiveIntegerField(
+        'Добавлено в избранное',
+        default=0,
+        editable=False,
+        db_index=True,
+    )
     is_favorited = models.BooleanField(default=False, verbose_name='Избранный')
     is_in_shopping_cart = models.BooleanField(
         default=False,
         verbose_name='В корзине',
     )
 
+    objects = RecipeManager()
+
     class Meta:
         verbose_name = 'Рецепт'
         ordering = ['-pub_date']
         verbose_name_plural = 'Recipe'
+        indexes = [
+            models.Index(fields=['author', '-pub_date'],
+                         name='recipe_author_pub_date_idx'),
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx')]
 
     def __str__(self):
         return f'{self.name}, {self.author}'
@@ -137,6 +229,149 @@ class RecipeIngredient(models.Model):
         return f'{self.ingredients} в рецепте: {self.recipes}'
 
 
+class UserRecipeManager(models.Manager):
+    """Массовые операции со списками рецептов пользователя без сигналов."""
+
+    def add_recipe(self, user_id, recipe_id):
+        """Добавляет рецепт одной вставкой; False, если он уже в списке."""
+        try:
+            with transaction.atomic():
+                self.create(user_id=user_id, recipes_id=recipe_id)
+        except IntegrityError:
+            return False
+        return True
+
+    def columns(self):
+        meta = self.model._meta
+        quote = connection.ops.quote_name
+        return (
+            quote(meta.db_table),
+            quote(meta.get_field('user').column),
+            quote(meta.get_field('recipes').column),
+        )
+
+    def insert_returning(self, user_id, recipe_ids):
+        """Вставка с ON CONFLICT, возвращающая только новые строки."""
+        table, user_column, recipe_column = self.columns()
+        pub_date = self.model._meta.get_field('pub_date')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({user_column}, {recipe_column}, '
+                f'{connection.ops.quote_name(pub_date.column)}) '
+                'SELECT %s, recipe_id, %s FROM unnest(%s::integer[]) '
+                'AS recipe_id ON CONFLICT DO NOTHING '
+                f'RETURNING {recipe_column}',
+                [
+                    user_id,
+                    pub_date.get_db_prep_value(timezone.now(), connection),
+                    recipe_ids
+                ]
+            )
+            return [recipe_id for recipe_id, in cursor.fetchall()]
+
+    def insert_new(self, user_id, recipe_ids):
+        """id рецептов, которые вставил именно этот вызов."""
+        if connection.vendor == 'postgresql':
+            return self.insert_returning(user_id, recipe_ids)
+        created = []
+        for recipe_id in recipe_ids:
+            try:
+                with transaction.atomic():
+                    self.bulk_create(
+                        [self.model(user_id=user_id, recipes_id=recipe_id)]
+                    )
+            except IntegrityError:
+                continue
+            created.append(recipe_id)
+        return created
+
+    def add_recipes(self, user_id, recipe_ids):
+        existing = set(self.filter(
+            user_id=user_id, recipes_id__in=recipe_ids
+        ).values_list('recipes_id', flat=True))
+        new = [pk for pk in recipe_ids if pk not in existing]
+        if not new:
+            return []
+        with transaction.atomic():
+            created = self.insert_new(user_id, new)
+            self.added(user_id, created)
+        if created:
+            self.relations_changed(user_id)
+        return created
+
+    def delete_returning(self, user_id, recipe_ids):
+        """Удаление с RETURNING, возвращающее только удалённые строки."""
+        table, user_column, recipe_column = self.columns()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE {user_column} = %s '
+                f'AND {recipe_column} = ANY(%s::integer[]) '
+                f'RETURNING {recipe_column}',
+                [user_id, recipe_ids]
+            )
+            return [recipe_id for recipe_id, in cursor.fetchall()]
+
+    def delete_existing(self, user_id, recipe_ids):
+        """id рецептов, которые удалил именно этот вызов."""
+        if connection.vendor == 'postgresql':
+            return self.delete_returning(user_id, recipe_ids)
+        removed = []
+        for recipe_id in recipe_ids:
+            queryset = self.filter(user_id=user_id, recipes_id=recipe_id)
+            if queryset._raw_delete(queryset.db):
+                removed.append(recipe_id)
+        return removed
+
+    def remove_recipes(self, user_id, recipe_ids):
+        if not recipe_ids:
+            return []
+        with transaction.atomic():
+            removed = self.delete_existing(user_id, recipe_ids)
+            self.removed(user_id, removed)
+        if removed:
+            self.relations_changed(user_id)
+        return removed
+
+    def relations_changed(self, user_id):
+        from .relations import RELATION_CACHES
+
+        RELATION_CACHES[self.model].invalidate(user_id)
+
+    def added(self, user_id, recipe_ids):
+        pass
+
+    def removed(self, user_id, recipe_ids):
+        pass
+
+
+class FavoriteManager(UserRecipeManager):
+    """Избранное со счётчиком добавлений у рецепта."""
+
+    def added(self, user_id, recipe_ids):
+        if recipe_ids:
+            change_counter(
+                Recipe.objects.filter(pk__in=recipe_ids), 'favorites_count', 1
+            )
+
+    def removed(self, user_id, recipe_ids):
+        if recipe_ids:
+            change_counter(
+                Recipe.objects.filter(pk__in=recipe_ids),
+                'favorites_count',
+                -1
+            )
+
+
+class ShoppingCartManager(UserRecipeManager):
+    """Корзина с итоговым списком покупок."""
+
+    def added(self, user_id, recipe_ids):
+        ShoppingListItem.objects.add_recipes(user_id, recipe_ids)
+
+    def removed(self, user_id, recipe_ids):
+        ShoppingListItem.objects.remove_recipes(user_id, recipe_ids)
+
+
 class Favorite(models.Model):
     """Модель для создания таблицы избранных."""
 
@@ -159,6 +394,8 @@ class Favorite(models.Model):
         db_index=True
     )
 
+    objects = FavoriteManager()
+
     class Meta:
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Favorite'
@@ -193,6 +430,8 @@ class ShoppingCart(models.Model):
         db_index=True
     )
 
+    objects = ShoppingCartManager()
+
     class Meta:
         verbose_name = 'Продуктовая корзина'
         verbose_name_plural = 'ShoppingCart'
@@ -205,6 +444,29 @@ class ShoppingCart(models.Model):
         return f'Рецепт "{self.recipes}" в корзине у пользователя: {self.user}'
 
 
+class FollowManager(models.Manager):
+    """Отписка, срабатывающая ровно один раз при гонке запросов."""
+
+    def unfollow(self, user_id, following_id):
+        """Удаляет подписку; False, если её уже удалил другой запрос.
+
+        QuerySet.delete() шлёт post_delete для собранных строк, даже если
+        DELETE уже ничего не удалил, поэтому сигнал отправляется вручную
+        и только для действительно удалённой строки.
+        """
+        with transaction.atomic():
+            queryset = self.filter(user_id=user_id, following_id=following_id)
+            if not queryset._raw_delete(queryset.db):
+                return False
+            models.signals.post_delete.send(
+                sender=self.model,
+                instance=self.model(user_id=user_id,
+                                    following_id=following_id),
+                using=queryset.db
+            )
+        return True
+
+
 class Follow(models.Model):
     """Модель для создания таблицы подписок."""
 
@@ -221,6 +483,8 @@ class Follow(models.Model):
         related_name='following',
     )
 
+    objects = FollowManager()
+
     class Meta:
         ordering = ['id']
         verbose_name = 'Подписка на автора'
@@ -231,3 +495,334 @@ class Follow(models.Model):
 
     def __str__(self):
         return f'{self.user} подписан на {self.following}'
+
+
+class ShoppingListManager(models.Manager):
+    """Инкрементальное обновление итогового списка покупок."""
+
+    def add_recipes(self, user_id, recipe_ids):
+        self.apply_delta([user_id], self.recipe_totals(recipe_ids))
+
+    def remove_recipes(self, user_id, recipe_ids):
+        totals = self.recipe_totals(recipe_ids)
+        self.apply_delta(
+            [user_id],
+            {ingredient: -amount for ingredient, amount in totals.items()}
+        )
+
+    def update_recipe(self, recipe_id, old_amounts, new_amounts):
+        delta = {
+            ingredient: new_amounts.get(ingredient, 0) - amount
+            for ingredient, amount in old_amounts.items()
+        }
+        for ingredient, amount in new_amounts.items():
+            delta.setdefault(ingredient, amount)
+        user_ids = list(ShoppingCart.objects.filter(
+            recipes_id=recipe_id
+        ).values_list('user_id', flat=True))
+        self.apply_delta(user_ids, delta)
+
+    def recipe_totals(self, recipe_ids):
+        totals = RecipeIngredient.objects.filter(
+            recipes_id__in=recipe_ids
+        ).values('ingredients_id').annotate(total=Sum('amount'))
+        return {row['ingredients_id']: row['total'] for row in totals}
+
+    def apply_delta(self, user_ids, delta):
+        delta = {
+            ingredient: amount for ingredient, amount in delta.items()
+            if amount
+        }
+        if not user_ids or not delta:
+            return
+        with transaction.atomic():
+            self.bulk_create(
+                [self.model(user_id=user_id, ingredients_id=ingredient)
+                 for user_id in user_ids
+                 for ingredient, amount in delta.items() if amount > 0],
+                ignore_conflicts=True
+            )
+            for ingredient, amount in delta.items():
+                self.filter(
+                    user_id__in=user_ids,
+                    ingredients_id=ingredient
+                ).update(amount=F('amount') + amount)
+            self.filter(user_id__in=user_ids, amount__lte=0).delete()
+
+
+class ShoppingListItem(models.Model):
+    """Модель для хранения суммарного списка покупок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_list'
+    )
+    ingredients = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+    )
+    amount = models.IntegerField(default=0, verbose_name='Количество')
+
+    objects = ShoppingListManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'ShoppingListItem'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredients'],
+                                    name='shopping_list_unique')]
+
+    def __str__(self):
+        return f'{self.ingredients} - {self.amount} у {self.user}'
+
+
+def fill_author_timelines(author_id):
+    """Фоновая задача: дополняет ленты подписчиков автора."""
+    try:
+        TimelineEntry.objects.fill_author(author_id)
+    except Exception:
+        logger.exception(
+            'Не удалось дополнить ленты подписчиков автора %s', author_id
+        )
+    finally:
+        connection.close()
+
+
+class TimelineManager(models.Manager):
+    """Лента рецептов авторов, на которых подписан пользователь.
+
+    Рецепты автора с флагом timeline_pulled не раскладываются по лентам, а
+    читаются при запросе. Флаг ставится, когда подписчиков становится больше
+    TIMELINE_FANOUT_LIMIT, и снимается только после того, как фоновая задача
+    разложит последние рецепты автора по лентам.
+    """
+
+    def pulled_authors(self, user_id):
+        """Авторы, чьи рецепты не раскладываются по лентам, а читаются."""
+        return Follow.objects.filter(
+            user_id=user_id, following__timeline_pulled=True
+        ).values('following')
+
+    def follower_batches(self, author_id):
+        """id подписчиков автора пачками по TIMELINE_BATCH_SIZE."""
+        followers = Follow.objects.filter(
+            following_id=author_id
+        ).order_by('user_id').values_list('user_id', flat=True)
+        last_id = 0
+        while True:
+            batch = list(followers.filter(
+                user_id__gt=last_id
+            )[:settings.TIMELINE_BATCH_SIZE])
+            if not batch:
+                return
+            yield batch
+            last_id = batch[-1]
+
+    def fan_out(self, recipe_id):
+        """Раскладывает новый рецепт по лентам подписчиков автора."""
+        recipe = Recipe.objects.select_related('author').only(
+            'pub_date', 'author__timeline_pulled'
+        ).filter(pk=recipe_id).first()
+        if recipe is None or recipe.author.timeline_pulled:
+            return
+        for batch in self.follower_batches(recipe.author_id):
+            self.bulk_create(
+                [
+                    self.model(user_id=user_id, recipe_id=recipe_id,
+                               pub_date=recipe.pub_date)
+                    for user_id in batch
+                ],
+                ignore_conflicts=True
+            )
+
+    def recent_recipes(self, author_id):
+        return list(Recipe.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-id'
+        ).values_list('pk', 'pub_date')[:settings.TIMELINE_BACKFILL_SIZE])
+
+    def author_followed(self, author_id):
+        """Переводит автора на чтение при запросе, если он перешёл предел."""
+        User.objects.filter(
+            pk=author_id,
+            timeline_pulled=False,
+            followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+        ).update(timeline_pulled=True)
+
+    def author_unfollowed(self, author_id):
+        """Ставит заполнение лент автора в фоновый пул после коммита."""
+        if User.objects.filter(
+            pk=author_id,
+            timeline_pulled=True,
+            followers_count__lte=settings.TIMELINE_FANOUT_LIMIT
+        ).exists():
+            transaction.on_commit(
+                lambda: get_executor().submit(fill_author_timelines, author_id)
+            )
+
+    def fill_recipes(self, author_id, recipes):
+        for batch in self.follower_batches(author_id):
+            self.bulk_create(
+                [
+                    self.model(user_id=user_id, recipe_id=recipe_id,
+                               pub_date=pub_date)
+                    for user_id in batch
+                    for recipe_id, pub_date in recipes
+                ],
+                batch_size=settings.TIMELINE_BATCH_SIZE,
+                ignore_conflicts=True
+            )
+
+    def fill_author(self, author_id):
+        """Раскладывает последние рецепты автора и снимает timeline_pulled.
+
+        Пока ленты заполняются, рецепты автора по-прежнему читаются при
+        запросе. Рецепты, опубликованные во время заполнения, не были
+        разложены и добавляются вторым проходом после снятия флага.
+        """
+        recipes = self.recent_recipes(author_id)
+        self.fill_recipes(author_id, recipes)
+        if not User.objects.filter(
+            pk=author_id,
+            timeline_pulled=True,
+            followers_count__lte=settings.TIMELINE_FANOUT_LIMIT
+        ).update(timeline_pulled=False):
+            return
+        filled = {recipe_id for recipe_id, _ in recipes}
+        self.fill_recipes(author_id, [
+            recipe for recipe in self.recent_recipes(author_id)
+            if recipe[0] not in filled
+        ])
+
+    def backfill(self, user_id, author_id):
+        """Добавляет в ленту последние рецепты нового автора."""
+        if User.objects.filter(pk=author_id, timeline_pulled=True).exists():
+            return
+        self.bulk_create(
+            [
+                self.model(user_id=user_id, recipe_id=recipe_id,
+                           pub_date=pub_date)
+                for recipe_id, pub_date in self.recent_recipes(author_id)
+            ],
+            ignore_conflicts=True
+        )
+
+    def remove_author(self, user_id, author_id):
+        queryset = self.filter(user_id=user_id, recipe__author_id=author_id)
+        queryset._raw_delete(queryset.db)
+
+    def page(self, user_id, limit, before=None, recipes=None):
+        """Рецепты ленты старше курсора before: [(id, pub_date), ...].
+
+        Разложенные записи читаются по индексу ленты, рецепты авторов
+        с большим числом подписчиков — по индексу рецептов; обе выборки
+        уже упорядочены по (pub_date, id) и сливаются без сортировки.
+        """
+        entries = self.filter(user_id=user_id)
+        pulled = Recipe.objects.filter(
+            author__in=self.pulled_authors(user_id)
+        ).exclude(Exists(
+            self.filter(user_id=user_id, recipe=OuterRef('pk'))
+        ))
+        if recipes is not None:
+            entries = entries.filter(recipe__in=recipes.values('pk'))
+            pulled = pulled.filter(pk__in=recipes.values('pk'))
+        if before is not None:
+            pub_date, recipe_id = before
+            entries = entries.filter(
+                Q(pub_date__lt=pub_date) | Q(recipe_id__lt=recipe_id),
+                pub_date__lte=pub_date
+            )
+            pulled = pulled.filter(
+                Q(pub_date__lt=pub_date) | Q(pk__lt=recipe_id),
+                pub_date__lte=pub_date
+            )
+        merged = heapq.merge(
+            entries.order_by('-pub_date', '-recipe_id').values_list(
+                'pub_date', 'recipe_id'
+            )[:limit],
+            pulled.order_by('-pub_date', '-id').values_list(
+                'pub_date', 'pk'
+            )[:limit],
+            reverse=True
+        )
+        return [
+            (recipe_id, pub_date)
+            for pub_date, recipe_id in itertools.islice(merged, limit)
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Модель для хранения ленты подписок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='timeline'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='timeline_entries'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    objects = TimelineManager()
+
+    class Meta:
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'TimelineEntry'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='timeline_unique')]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='timeline_user_pub_date_idx')]
+
+    def __str__(self):
+        return f'"{self.recipe}" в ленте у пользователя: {self.user}'
+
+
+class MediaBlobManager(models.Manager):
+    """Подсчёт ссылок на файлы картинок."""
+
+    def acquire(self, name):
+        with transaction.atomic():
+            self.bulk_create([self.model(name=name)], ignore_conflicts=True)
+            self.filter(name=name).update(references=F('references') + 1)
+
+    def release(self, name):
+        with transaction.atomic():
+            self.filter(name=name, references__gt=0).update(
+                references=F('references') - 1
+            )
+            deleted, _ = self.filter(name=name, references=0).delete()
+        if deleted:
+            transaction.on_commit(lambda: delete_image_files(name))
+
+
+class MediaBlob(models.Model):
+    """Модель для учёта ссылок на сохранённые картинки."""
+
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Файл',
+    )
+    references = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество ссылок',
+    )
+
+    objects = MediaBlobManager()
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'MediaBlob'
+
+    def __str__(self):
+        return f'{self.name} ({self.references})'
@@ -0,0 +1,97 @@
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from threading import Lock
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Favorite, Follow, ShoppingCart
+
+
+class IdSet:
+    """Неизменяемое множество id в отсортированном массиве."""
+
+    __slots__ = ('ids',)
+
+    def __init__(self, ids):
+        self.ids = array('q', sorted(ids))
+
+    def __contains__(self, pk):
+        index = bisect_left(self.ids, pk)
+        return index < len(self.ids) and self.ids[index] == pk
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class UserRelationCache:
+    """id рецептов или авторов, связанных с пользователем.
+
+    Наборы недавних пользователей хранятся в памяти процесса, лишние
+    вытесняются по LRU. Версия набора лежит в общем кэше Django и меняется
+    после каждой записи, поэтому другие воркеры перечитывают набор одним
+    запросом при следующем обращении.
+    """
+
+    def __init__(self, model, field):
+        self.model = model
+        self.field = field
+        self._sets = OrderedDict()
+        self._lock = Lock()
+
+    def version_key(self, user_id):
+        return f'relation-version:{self.model._meta.label_lower}:{user_id}'
+
+    def version(self, user_id):
+        key = self.version_key(user_id)
+        version = cache.get(key)
+        if version is not None:
+            return version
+        cache.add(key, uuid4().hex, None)
+        return cache.get(key)
+
+    def get(self, user_id):
+        version = self.version(user_id)
+        with self._lock:
+            cached_version, ids = self._sets.get(user_id, (None, None))
+            if cached_version == version:
+                self._sets.move_to_end(user_id)
+                return ids
+        return self.store(user_id, version, IdSet(
+            self.model.objects.filter(
+                user_id=user_id
+            ).values_list(self.field, flat=True)
+        ))
+
+    def store(self, user_id, version, ids):
+        with self._lock:
+            self._sets[user_id] = (version, ids)
+            self._sets.move_to_end(user_id)
+            while len(self._sets) > settings.RELATION_CACHE_USERS:
+                self._sets.popitem(last=False)
+        return ids
+
+    def invalidate(self, user_id):
+        def bump():
+            cache.set(self.version_key(user_id), uuid4().hex, None)
+            with self._lock:
+                self._sets.pop(user_id, None)
+
+        transaction.on_commit(bump)
+
+
+favorite_ids = UserRelationCache(Favorite, 'recipes_id')
+shopping_cart_ids = UserRelationCache(ShoppingCart, 'recipes_id')
+following_ids = UserRelationCache(Follow, 'following_id')
+
+RELATION_CACHES = {
+    Favorite: favorite_ids,
+    ShoppingCart: shopping_cart_ids,
+    Follow: following_ids,
+}
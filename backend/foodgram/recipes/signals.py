@@ -0,0 +1,264 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import fulltext
+from .cache import tag_cache
+from .fragments import recipe_fragments
+from .ingredient_index import ingredient_index
+from .models import (Favorite, Follow, Ingredient, MediaBlob, Recipe,
+                     RecipeIngredient, ShoppingCart, ShoppingListItem, Tag,
+                     TimelineEntry, User, change_counter, tags_mask)
+from .relations import RELATION_CACHES
+
+
+def touch_recipes(recipes):
+    """Меняет версию рецептов: фрагменты и ETag строятся заново."""
+    recipes.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_added(sender, instance, created, **kwargs):
+    if created:
+        ShoppingListItem.objects.add_recipes(
+            instance.user_id, [instance.recipes_id]
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def shopping_cart_removed(sender, instance, **kwargs):
+    ShoppingListItem.objects.remove_recipes(
+        instance.user_id, [instance.recipes_id]
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_renamed(sender, instance, created, **kwargs):
+    if created:
+        return
+    recipe_ids = list(RecipeIngredient.objects.filter(
+        ingredients=instance
+    ).values_list('recipes', flat=True).distinct())
+    touch_recipes(Recipe.objects.filter(pk__in=recipe_ids))
+    transaction.on_commit(lambda: fulltext.index_recipes(recipe_ids))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    transaction.on_commit(tag_cache.bump)
+
+
+def update_tags_mask(recipes, add=0, remove=0):
+    recipes.update(
+        tags_mask=F('tags_mask').bitor(add).bitand(~remove),
+        updated_at=timezone.now()
+    )
+
+
+def remove_tag_bit(tag_id):
+    bit = tags_mask([tag_id])
+    if bit:
+        update_tags_mask(
+            Recipe.objects.alias(
+                tag_bit=F('tags_mask').bitand(bit)
+            ).exclude(tag_bit=0),
+            remove=bit
+        )
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    remove_tag_bit(instance.pk)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        if action == 'post_clear':
+            remove_tag_bit(instance.pk)
+        elif pk_set:
+            bit = tags_mask([instance.pk])
+            update_tags_mask(
+                Recipe.objects.filter(pk__in=pk_set),
+                add=bit if action == 'post_add' else 0,
+                remove=bit if action == 'post_remove' else 0
+            )
+        return
+    recipes = Recipe.objects.filter(pk=instance.pk)
+    if action == 'post_clear':
+        recipes.update(tags_mask=0, updated_at=timezone.now())
+    else:
+        mask = tags_mask(pk_set)
+        update_tags_mask(
+            recipes,
+            add=mask if action == 'post_add' else 0,
+            remove=mask if action == 'post_remove' else 0
+        )
+    instance.refresh_from_db(fields=['tags_mask', 'updated_at'])
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_image_remember(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None or (
+        update_fields is not None and 'image' not in update_fields
+    ):
+        return
+    instance._stored_image = Recipe.objects.filter(
+        pk=instance.pk
+    ).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_changed(sender, instance, created, **kwargs):
+    if not created and not hasattr(instance, '_stored_image'):
+        return
+    old_name = getattr(instance, '_stored_image', None)
+    new_name = instance.image.name if instance.image else None
+    instance._stored_image = new_name
+    if old_name == new_name:
+        return
+    if new_name:
+        MediaBlob.objects.acquire(new_name)
+    if old_name:
+        MediaBlob.objects.release(old_name)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_image_deleted(sender, instance, **kwargs):
+    if instance.image:
+        MediaBlob.objects.release(instance.image.name)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe.objects.filter(pk=instance.recipes_id), 'favorites_count', 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_removed(sender, instance, **kwargs):
+    change_counter(
+        Recipe.objects.filter(pk=instance.recipes_id), 'favorites_count', -1
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', 1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    change_counter(
+        User.objects.filter(pk=instance.author_id), 'recipes_count', -1
+    )
+
+
+@receiver(post_save, sender=Follow)
+def follow_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            User.objects.filter(pk=instance.following_id),
+            'followers_count',
+            1
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def follow_removed(sender, instance, **kwargs):
+    change_counter(
+        User.objects.filter(pk=instance.following_id), 'followers_count', -1
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_search_changed(sender, instance, **kwargs):
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: fulltext.index_recipes([recipe_id]))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_search_deleted(sender, instance, **kwargs):
+    fulltext.remove_recipes([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_fragment_deleted(sender, instance, **kwargs):
+    recipe_fragments.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    touch_recipes(Recipe.objects.filter(pk=instance.recipes_id))
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is not None and (
+        set(update_fields) <= {'last_login'}
+    ):
+        return
+    touch_recipes(Recipe.objects.filter(author=instance))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def user_relation_changed(sender, instance, **kwargs):
+    RELATION_CACHES[sender].invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, **kwargs):
+    if created:
+        recipe_id = instance.pk
+        transaction.on_commit(
+            lambda: TimelineEntry.objects.fan_out(recipe_id)
+        )
+
+
+@receiver(post_save, sender=Follow)
+def timeline_followed(sender, instance, created, **kwargs):
+    if created:
+        TimelineEntry.objects.backfill(
+            instance.user_id, instance.following_id
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def timeline_unfollowed(sender, instance, **kwargs):
+    TimelineEntry.objects.remove_author(
+        instance.user_id, instance.following_id
+    )
+
+
+@receiver(post_save, sender=Follow)
+def timeline_author_grown(sender, instance, created, **kwargs):
+    if created:
+        TimelineEntry.objects.author_followed(instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def timeline_author_dropped(sender, instance, **kwargs):
+    TimelineEntry.objects.author_unfollowed(instance.following_id)
@@ -0,0 +1,63 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+DERIVED_DIRECTORY = 'variants'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, раскладывающее файлы по SHA-256 их содержимого.
+
+    Одинаковые файлы сохраняются один раз: повторная загрузка возвращает
+    имя уже существующего файла. Производные файлы (уменьшенные копии
+    в каталогах variants) сохраняются под переданным именем.
+    """
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        checksum = digest.hexdigest()
+        return os.path.join(
+            os.path.dirname(name),
+            checksum[:2],
+            checksum[2:4],
+            checksum + os.path.splitext(name)[1].lower()
+        )
+
+    def is_derived(self, name):
+        return DERIVED_DIRECTORY in name.split('/')
+
+    def get_available_name(self, name, max_length=None):
+        """Имя по содержимому не меняется: занятое имя — тот же файл.
+
+        FileExistsError прерывает и повторную попытку в _save, когда
+        одинаковый файл одновременно сохраняет другой запрос.
+        """
+        if self.is_derived(name):
+            return super().get_available_name(name, max_length)
+        if self.exists(name):
+            raise FileExistsError(name)
+        return name
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        if self.is_derived(name):
+            self.delete(name)
+            return super().save(name, content, max_length)
+        name = self.hashed_name(name, content)
+        try:
+            return super().save(name, content, max_length)
+        except FileExistsError:
+            return name
+
+
+recipe_image_storage = ContentAddressedStorage()
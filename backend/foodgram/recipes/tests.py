@@ -0,0 +1,82 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+
+from .ingredient_index import ingredient_index
+from .models import Ingredient
+from .storage import ContentAddressedStorage
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class IngredientIndexTest(TestCase):
+    """Снимок индекса ингредиентов не переживает изменение справочника."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            INGREDIENT_INDEX_PATH=f'{directory.name}/ingredients.idx'
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+        self.ingredient = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+
+    def names(self, query):
+        return [item['name'] for item in ingredient_index.search(query)]
+
+    def test_rename_rebuilds_index(self):
+        self.assertEqual(self.names('мук'), ['мука'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredient.name = 'мука ржаная'
+            self.ingredient.save()
+        self.assertEqual(self.names('мук'), ['мука ржаная'])
+
+    def test_build_racing_with_change_is_not_served(self):
+        ingredient_index.build(ingredient_index.version())
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='мускат', measurement_unit='г')
+        self.assertEqual(self.names('му'), ['мука', 'мускат'])
+
+
+class ContentAddressedStorageTest(TestCase):
+    """Одинаковое содержимое всегда сохраняется под одним именем."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = ContentAddressedStorage(location=directory.name)
+
+    def files(self, name):
+        directory = os.path.dirname(self.storage.path(name))
+        return os.listdir(directory)
+
+    def test_same_content_same_name(self):
+        name = self.storage.save('images/a.png', ContentFile(b'image'))
+        self.assertEqual(
+            self.storage.save('images/b.PNG', ContentFile(b'image')), name
+        )
+        self.assertEqual(self.files(name), [os.path.basename(name)])
+
+    def test_concurrent_save_keeps_hashed_name(self):
+        name = self.storage.save('images/a.png', ContentFile(b'image'))
+        with mock.patch.object(
+            self.storage, 'exists', side_effect=[False, True]
+        ):
+            self.assertEqual(
+                self.storage.save('images/b.png', ContentFile(b'image')),
+                name
+            )
+        self.assertEqual(self.files(name), [os.path.basename(name)])
@@ -1,8 +1,10 @@
 from django.contrib import admin
+from recipes.admin import ScalableModelAdmin
 
 from .models import User
 
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
-    list_filter = ('email', 'username',)
+class UserAdmin(ScalableModelAdmin):
+    list_display = ('username', 'email', 'recipes_count', 'followers_count')
+    search_fields = ('username', 'email')
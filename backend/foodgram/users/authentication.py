@@ -0,0 +1,112 @@
+import copy
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+
+def auth_version_key(token_key):
+    digest = hashlib.sha256(token_key.encode()).hexdigest()
+    return f'auth-version:{digest}'
+
+
+def bump_auth_version(token_key):
+    cache.set(auth_version_key(token_key), uuid4().hex, None)
+
+
+def get_auth_version(token_key):
+    key = auth_version_key(token_key)
+    version = cache.get(key)
+    if version is not None:
+        return version
+    cache.add(key, uuid4().hex, None)
+    return cache.get(key)
+
+
+class TokenCache:
+    """Токены, недавно прошедшие проверку, в памяти процесса.
+
+    Запись живёт не дольше AUTH_TOKEN_CACHE_TTL секунд, лишние вытесняются
+    по LRU. При каждом обращении запись сверяется с версией токена в общем
+    кэше Django, поэтому выход из системы, удаление токена и смена
+    прав действуют сразу во всех воркерах.
+    """
+
+    def __init__(self):
+        self._tokens = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._tokens[key]
+                entry = None
+        if entry is not None:
+            _, version, user = entry
+            if version == get_auth_version(key):
+                with self._lock:
+                    if key in self._tokens:
+                        self._tokens.move_to_end(key)
+                    self.hits += 1
+                return user
+            with self._lock:
+                self._tokens.pop(key, None)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, version, user):
+        with self._lock:
+            self._tokens[key] = (
+                time.monotonic() + settings.AUTH_TOKEN_CACHE_TTL,
+                version,
+                user
+            )
+            self._tokens.move_to_end(key)
+            while len(self._tokens) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self._tokens.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'size': len(self._tokens),
+                'max_size': settings.AUTH_TOKEN_CACHE_SIZE,
+                'ttl': settings.AUTH_TOKEN_CACHE_TTL,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / requests if requests else None,
+            }
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к БД для недавно виденных токенов."""
+
+    def authenticate_credentials(self, key):
+        user = token_cache.get(key)
+        if user is None:
+            version = get_auth_version(key)
+            token = self.get_model().objects.select_related(
+                'user'
+            ).filter(key=key).first()
+            if token is None:
+                raise AuthenticationFailed(_('Invalid token.'))
+            user = token.user
+            if user.is_active:
+                token_cache.set(key, version, user)
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return copy.copy(user), key
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.15 on 2026-10-18 17:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pulled_authors(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    User.objects.filter(
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT
+    ).update(timeline_pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='timeline_pulled',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Рецепты читаются в ленту при запросе'),
+        ),
+        migrations.RunPython(mark_pulled_authors, migrations.RunPython.noop),
+    ]
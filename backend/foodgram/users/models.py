@@ -12,9 +12,28 @@ class User(AbstractUser):
         'last_name',
     ]
     email = models.EmailField(unique=True)
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False,
+    )
+    timeline_pulled = models.BooleanField(
+        'Рецепты читаются в ленту при запросе',
+        default=False,
+        editable=False,
+    )
 
     class Meta:
         verbose_name_plural = 'User'
 
+    @property
+    def is_admin(self):
+        return self.is_staff or self.is_superuser
+
     def __str__(self):
         return self.username
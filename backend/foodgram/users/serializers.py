@@ -2,6 +2,7 @@ import api.serializers as api
 from django.contrib.auth import get_user_model
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from recipes.models import Follow, Recipe
+from recipes.relations import following_ids
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.relations import SlugRelatedField
@@ -9,6 +10,15 @@ from rest_framework.relations import SlugRelatedField
 User = get_user_model()
 
 
+def get_recipes_limit(request):
+    if request is None:
+        return None
+    limit = request.query_params.get('recipes_limit')
+    if limit is None or not limit.isdigit():
+        return None
+    return int(limit)
+
+
 class CustomUserSerializer(UserSerializer):
     """Сериализатор для получения информации о пользователе."""
 
@@ -20,11 +30,13 @@ class CustomUserSerializer(UserSerializer):
                   'first_name', 'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        user = request.user
-        return Follow.objects.filter(following=obj, user=user).exists()
+        following = self.context.get('following')
+        if following is None:
+            request = self.context.get('request')
+            if request is None or request.user.is_anonymous:
+                return False
+            following = following_ids.get(request.user.pk)
+        return obj.pk in following
 
 
 class UserSignInSerializer(UserCreateSerializer):
@@ -48,7 +60,7 @@ class SubUserSerializer(UserSerializer):
 
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         model = User
@@ -59,13 +71,15 @@ class SubUserSerializer(UserSerializer):
         return True
 
     def get_recipes(self, obj):
-        queryset = Recipe.objects.filter(author=obj.id)
+        queryset = getattr(obj, 'recipes_page', None)
+        if queryset is None:
+            queryset = Recipe.objects.filter(author=obj.id)
+            limit = get_recipes_limit(self.context.get('request'))
+            if limit is not None:
+                queryset = queryset[:limit]
         serializer = api.RecipeMiniSerializer(queryset, many=True)
         return serializer.data
 
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.id).count()
-
 
 class FollowSerializer(serializers.ModelSerializer):
     """Сериализатор для модели подписок."""
@@ -80,20 +94,11 @@ class FollowSerializer(serializers.ModelSerializer):
         required=False
     )
 
-    def validate(self, data):
-        user = data.get('user')
-        following = data.get('following')
-        if user == following:
-            raise serializers.ValidationError(
-                'Нельзя подписаться на самого себя.')
-        if Follow.objects.filter(user=user, following=following).exists():
-            raise serializers.ValidationError('Вы уже подписаны.')
-        return data
-
     class Meta:
         model = Follow
         fields = ('user', 'following')
 
     def to_representation(self, instance):
-        serializer = SubUserSerializer(instance.following)
+        serializer = SubUserSerializer(instance.following,
+                                       context=self.context)
         return serializer.data
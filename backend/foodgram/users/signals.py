@@ -0,0 +1,32 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import bump_auth_version
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    key = instance.key
+    transaction.on_commit(lambda: bump_auth_version(key))
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is not None and (
+        set(update_fields) <= {'last_login'}
+    ):
+        return
+    keys = list(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
+
+    def bump():
+        for key in keys:
+            bump_auth_version(key)
+
+    transaction.on_commit(bump)
@@ -1,7 +1,7 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import CustomUserViewSet, FollowViewSet
+from .views import CustomUserViewSet, FollowViewSet, TokenCacheStatsView
 
 router = DefaultRouter()
 
@@ -22,6 +22,8 @@ router.register(
     basename='subscribe'
 )
 urlpatterns = [
+    path('auth/token/stats/', TokenCacheStatsView.as_view(),
+         name='token-cache-stats'),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
 ]
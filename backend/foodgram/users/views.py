@@ -1,20 +1,29 @@
+from api.pagination import CursorPaginationMixin, UserCursorPagination
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
-from recipes.models import Follow
+from recipes.models import Follow, Recipe
+from recipes.relations import following_ids
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import LimitOffsetPagination
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 
+from .authentication import token_cache
 from .serializers import (CustomUserSerializer, FollowSerializer,
-                          UserSignInSerializer)
+                          SubUserSerializer, UserSignInSerializer,
+                          get_recipes_limit)
 
 User = get_user_model()
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(CursorPaginationMixin, UserViewSet):
     """Вьюсет для пользователей."""
 
     def get_serializer_class(self):
@@ -22,6 +31,13 @@ class CustomUserViewSet(UserViewSet):
             return CustomUserSerializer
         return UserSignInSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        user = self.request.user
+        if self.request.method == 'GET' and user.is_authenticated:
+            context['following'] = following_ids.get(user.pk)
+        return context
+
     @action(methods=['get'],
             detail=False,
             permission_classes=(IsAuthenticated,),
@@ -36,14 +52,39 @@ class CustomUserViewSet(UserViewSet):
     queryset = User.objects.all()
     permission_classes = (AllowAny,)
     pagination_class = LimitOffsetPagination
+    cursor_pagination_class = UserCursorPagination
 
 
 class FollowViewSet(viewsets.ModelViewSet):
     """Вьюсет для списка подписок."""
 
     def get_queryset(self):
-        user = self.request.user
-        return user.follower.all()
+        authors = User.objects.all()
+        if get_recipes_limit(self.request) is None:
+            authors = authors.prefetch_related(Prefetch(
+                'recipes',
+                queryset=Recipe.objects.order_by('-pub_date'),
+                to_attr='recipes_page'
+            ))
+        return self.request.user.follower.prefetch_related(
+            Prefetch('following', queryset=authors)
+        )
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        follows = list(queryset) if page is None else page
+        limit = get_recipes_limit(request)
+        if limit is not None:
+            recipes = Recipe.objects.latest_by_author(
+                [follow.following_id for follow in follows], limit
+            )
+            for follow in follows:
+                follow.following.recipes_page = recipes[follow.following_id]
+        serializer = self.get_serializer(follows, many=True)
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
 
     serializer_class = FollowSerializer
     pagination_class = LimitOffsetPagination
@@ -52,18 +93,35 @@ class FollowViewSet(viewsets.ModelViewSet):
     @action(detail=False, permission_classes=(IsAuthenticated,),
             url_path='subscribe', methods=['delete', 'post'])
     def subscribe(self, request, **kwargs):
+        following_id = self.kwargs.get('users_id')
+        user = request.user
         if request.method == 'DELETE':
-            following = self.kwargs.get('users_id')
-            user = self.request.user
-            follow = get_object_or_404(Follow, user=user, following=following)
-            follow.delete()
+            if not Follow.objects.unfollow(user.pk, following_id):
+                raise NotFound()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
-        following_id = self.kwargs.get('users_id')
         following = get_object_or_404(User, pk=following_id)
-        user = request.user
-        serializer = FollowSerializer(
-            data={'user': user, 'following': following.id})
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        if following == user:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                'Нельзя подписаться на самого себя.'
+            ]})
+        try:
+            with transaction.atomic():
+                Follow.objects.create(user=user, following=following)
+        except IntegrityError:
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                'Вы уже подписаны.'
+            ]})
+        serializer = SubUserSerializer(
+            following, context=self.get_serializer_context()
+        )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class TokenCacheStatsView(APIView):
+    """Счётчики кэша токенов текущего воркера."""
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(token_cache.stats())